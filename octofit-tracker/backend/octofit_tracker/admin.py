@@ -35,8 +35,8 @@ class WorkoutAdmin(admin.ModelAdmin):
 
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
-    list_display = ['_id', 'user_name', 'team_id', 'rank', 'total_calories', 'total_activities', 'updated_at']
+    list_display = ['_id', 'user_name', 'team_id', 'total_calories', 'total_activities', 'updated_at']
     list_filter = ['team_id', 'updated_at']
     search_fields = ['user_name', 'user_id', '_id']
     readonly_fields = ['updated_at']
-    ordering = ['rank']
+    ordering = ['-total_calories', '_id']
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class OctofitTrackerConfig(AppConfig):
+    name = 'octofit_tracker'
+
+    def ready(self):
+        from . import mongo, perf, signals  # noqa: F401
@@ -0,0 +1,216 @@
+"""
+Async versions of the read-heavy endpoints.
+
+They are plain Django async views over Motor, so under the ASGI application
+a request waiting on MongoDB yields the event loop instead of holding a
+worker thread. Responses match their DRF counterparts: the same precompiled
+encoders, sort orders and JSON encoder.
+
+They are ASGI-only. Under WSGI (runserver, gunicorn sync workers) Django
+would run every call on a new event loop, which needs a new Motor client
+with its own pool and monitor threads, so the routes answer 404 there and
+clients should use the /api/ endpoints instead.
+"""
+import asyncio
+from functools import wraps
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from pymongo import ASCENDING
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import ranks, stats, windows
+from .perf import db_wait
+from .encoders import get_encoder
+from .indexes import ACTIVITY_ORDER
+from .mongo import client_options
+from .serializers import (
+    UserSerializer, ActivitySerializer, LeaderboardSerializer, requested_fields
+)
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # Motor missing, or Motor 2.x on Python 3.11+
+    AsyncIOMotorClient = None
+
+# One client per event loop: Motor clients are bound to the loop they run on
+_clients = {}
+
+
+def get_async_db():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncIOMotorClient(**client_options(), io_loop=loop)
+        _clients[loop] = client
+    return client[settings.DATABASES['default']['NAME']]
+
+
+def close_async_client():
+    """Close the running loop's client, along with its connections and monitor threads"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        client.close()
+
+
+def async_view(view):
+    """Serve the view only to requests handled by the ASGI application"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return _not_found()
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _encoder(request, serializer_class):
+    names = [name for name, _, _ in get_encoder(serializer_class).fields]
+    return get_encoder(serializer_class, requested_fields(request, names))
+
+
+async def _annotate_ranks(documents, collection=ranks.COLLECTION, tree=None):
+    """Async counterpart of ranks.annotate for leaderboard documents"""
+    scores = {document.get('total_calories') for document in documents}
+    if scores:
+        cursor = get_async_db()[collection].find(ranks.rank_query(scores, tree))
+        with db_wait():
+            nodes = await cursor.to_list(length=None)
+        found = ranks.ranks_from_nodes(scores, nodes, tree)
+        for document in documents:
+            document['rank'] = found[document.get('total_calories')]
+    return documents
+
+
+async def _annotate_window_ranks(query, documents):
+    """Async counterpart of windows.annotate"""
+    if windows.whole_window(query):
+        return ranks.annotate_sorted(documents)
+    return await _annotate_ranks(documents, windows.RANKS_COLLECTION,
+                                 windows.tree_name(query['window'], query['start']))
+
+
+async def _leaderboard(request, filters, limit=None):
+    """Ranked leaderboard rows for `?window=`; ValueError on unknown windows"""
+    window = windows.parse_window(request.GET.get('window'))
+    encoder = _encoder(request, LeaderboardSerializer)
+    if window == 'all':
+        return await _find('leaderboard', filters, ranks.LEADERBOARD_ORDER, encoder, limit=limit,
+                           annotate=_annotate_ranks)
+    query = windows.window_query(window, filters)
+
+    async def annotate(documents):
+        return await _annotate_window_ranks(query, documents)
+    return await _find(windows.COLLECTION, query, ranks.LEADERBOARD_ORDER, encoder, limit=limit,
+                       annotate=annotate)
+
+
+async def _find(collection, query, sort, encoder, limit=None, annotate=None):
+    if limit == 0:
+        # Motor reads a zero limit as no limit
+        return []
+    projection = {source: 1 for source in encoder.sources}
+    projection.update({field: 1 for field, _ in sort})
+    cursor = get_async_db()[collection].find(query, projection).sort(sort)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    with db_wait():
+        documents = await cursor.to_list(length=None)
+    if annotate is not None:
+        documents = await annotate(documents)
+    return encoder.encode_many(documents)
+
+
+async def _exists(collection, pk):
+    with db_wait():
+        return await get_async_db()[collection].count_documents({'_id': pk}, limit=1)
+
+
+def _json(data, status=200):
+    # DRF's encoder keeps microseconds, which DjangoJSONEncoder truncates
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+def _error(message, status=400):
+    return _json({'error': message}, status=status)
+
+
+def _not_found():
+    return _json({'detail': 'Not found.'}, status=404)
+
+
+@async_view
+async def leaderboard_top(request):
+    """Get top N entries from the all-time, weekly or monthly leaderboard"""
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        return _error('limit must be a non-negative integer')
+    try:
+        rows = await _leaderboard(request, {}, limit=limit)
+    except ValueError as exc:
+        return _error(str(exc))
+    return _json(rows)
+
+
+@async_view
+async def leaderboard_by_team(request):
+    """Get the all-time, weekly or monthly leaderboard filtered by team_id query parameter"""
+    team_id = request.GET.get('team_id')
+    if not team_id:
+        return _error('team_id parameter required')
+    try:
+        rows = await _leaderboard(request, {'team_id': team_id})
+    except ValueError as exc:
+        return _error(str(exc))
+    return _json(rows)
+
+
+@async_view
+async def user_activities(request, pk):
+    """Get all activities for a specific user"""
+    if not await _exists('users', pk):
+        return _not_found()
+    rows = await _find('activities', {'user_id': pk}, ACTIVITY_ORDER,
+                       _encoder(request, ActivitySerializer))
+    return _json(rows)
+
+
+@async_view
+async def user_stats(request, pk):
+    """Get statistics for a specific user, optionally windowed by date and grouped"""
+    if not await _exists('users', pk):
+        return _not_found()
+    db = get_async_db()
+    params = request.GET
+    if any(params.get(name) for name in ('from', 'to', 'group_by')):
+        group_by = params.get('group_by') or None
+        if group_by and group_by not in stats.GROUP_BY_FIELDS:
+            return _error(f'group_by must be one of: {", ".join(stats.GROUP_BY_FIELDS)}')
+        try:
+            start = stats.parse_bound(params.get('from'))
+            end = stats.parse_bound(params.get('to'), end=True)
+        except ValueError:
+            return _error('from and to must be ISO 8601 dates or datetimes')
+        cursor = db.activities.aggregate(stats.user_stats_pipeline(pk, start, end, group_by))
+        with db_wait():
+            rows = await cursor.to_list(length=None)
+        return _json(stats.summarize(pk, rows, start, end, group_by))
+    with db_wait():
+        entry = await db.leaderboard.find_one({'user_id': pk})
+    if entry is None:
+        return _json({'message': 'No stats available'}, status=404)
+    await _annotate_ranks([entry])
+    return _json(_encoder(request, LeaderboardSerializer).encode(entry))
+
+
+@async_view
+async def team_members(request, pk):
+    """Get all members of a team"""
+    if not await _exists('teams', pk):
+        return _not_found()
+    rows = await _find('users', {'team_id': pk}, [('name', ASCENDING)],
+                       _encoder(request, UserSerializer))
+    return _json(rows)
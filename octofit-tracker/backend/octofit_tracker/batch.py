@@ -0,0 +1,69 @@
+"""
+Batch fetch by ID list.
+
+`?ids=a,b,c` on a list endpoint, or `POST .../batch/` with `{"ids": [...]}`
+for long lists, resolves every ID with a single `$in` query on `_id` and
+returns the rows in the requested order along with the IDs not found.
+"""
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from . import repository
+
+
+class BatchFetchMixin:
+    """Adds `?ids=` to list() and a `batch` POST action; use with FastReadMixin"""
+    ids_query_param = 'ids'
+    max_batch_ids = 1000
+
+    def batch_requested(self):
+        return self.ids_query_param in self.request.query_params
+
+    def parse_ids(self, ids):
+        """Deduplicate a list of IDs keeping its order; ValueError when unusable"""
+        if not isinstance(ids, list) or not all(isinstance(value, str) for value in ids):
+            raise ValueError('ids must be a list of strings')
+        ids = list(dict.fromkeys(value.strip() for value in ids if value.strip()))
+        if not ids:
+            raise ValueError('ids must not be empty')
+        if len(ids) > self.max_batch_ids:
+            raise ValueError(f'At most {self.max_batch_ids} ids can be fetched at once')
+        return ids
+
+    def batch_rows(self, ids, fields):
+        """Serialized rows for `ids` in any order; `fields` always includes the primary key"""
+        model = self.get_queryset().model
+        context = self.get_serializer_context()
+        if fields is not None:
+            # Serializers would otherwise narrow to the request's `?fields=`, without the key
+            context['fields'] = fields
+        return repository.rows(model, {f'{model._meta.pk.name}__in': ids}, self.get_serializer_class(),
+                               fields, context=context, annotate=self.annotate_rows)
+
+    def batch_response(self, ids):
+        try:
+            ids = self.parse_ids(ids)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        pk = self.get_queryset().model._meta.pk.name
+        selected = self.selected_fields()
+        fields = None if selected is None else selected | {pk}
+        found = {row[pk]: row for row in self.batch_rows(ids, fields)}
+        if fields is not None and pk not in selected:
+            for row in found.values():
+                del row[pk]
+        return Response({
+            'results': [found[value] for value in ids if value in found],
+            'missing': [value for value in ids if value not in found],
+        })
+
+    def list(self, request, *args, **kwargs):
+        if self.batch_requested():
+            return self.batch_response(request.query_params[self.ids_query_param].split(','))
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Fetch the objects whose IDs are listed in the `ids` body field"""
+        return self.batch_response(request.data.get('ids') if hasattr(request.data, 'get') else None)
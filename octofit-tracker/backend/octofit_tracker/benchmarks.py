@@ -0,0 +1,153 @@
+"""
+Endpoint latency benchmarks.
+
+Requests are driven in-process through Django's test client so the numbers
+cover the full middleware, DRF and database stack without network noise.
+MongoDB commands are counted with a pymongo command listener, which sees
+both djongo's ORM queries and the native pymongo paths.
+"""
+import math
+import threading
+import time
+
+from django.test import Client
+from pymongo import monitoring
+
+from .mongo import get_db
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands issued by every client created after registration"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def sample_ids(db=None):
+    """Pick one existing id of each kind to parameterize the endpoint paths"""
+    db = db if db is not None else get_db()
+
+    def first(collection, field='_id', query=None):
+        document = db[collection].find_one(query or {}, {field: 1})
+        return document.get(field) if document else None
+
+    return {
+        'user_id': first('users'),
+        'team_id': first('teams'),
+        'activity_id': first('activities'),
+        'activity_type': first('activities', 'type'),
+        'workout_id': first('workouts'),
+        'difficulty': first('workouts', 'difficulty'),
+        'leaderboard_id': first('leaderboard'),
+        'leaderboard_user_id': first('leaderboard', 'user_id'),
+    }
+
+
+def endpoints(ids):
+    """(name, path) for every router endpoint and custom action"""
+    return [
+        ('users list', '/api/users/'),
+        ('users detail', f'/api/users/{ids["user_id"]}/'),
+        ('users activities', f'/api/users/{ids["user_id"]}/activities/'),
+        ('users stats', f'/api/users/{ids["user_id"]}/stats/'),
+        ('users stats by type', f'/api/users/{ids["user_id"]}/stats/?group_by=type'),
+        ('users recommended workouts', f'/api/users/{ids["user_id"]}/recommended-workouts/'),
+        ('teams list', '/api/teams/'),
+        ('teams detail', f'/api/teams/{ids["team_id"]}/'),
+        ('teams members', f'/api/teams/{ids["team_id"]}/members/'),
+        ('teams leaderboard', f'/api/teams/{ids["team_id"]}/leaderboard/'),
+        ('teams ranking', '/api/teams/ranking/'),
+        ('activities list', '/api/activities/'),
+        ('activities detail', f'/api/activities/{ids["activity_id"]}/'),
+        ('activities by_user', f'/api/activities/by_user/?user_id={ids["user_id"]}'),
+        ('activities by_type', f'/api/activities/by_type/?type={ids["activity_type"]}'),
+        ('workouts list', '/api/workouts/'),
+        ('workouts detail', f'/api/workouts/{ids["workout_id"]}/'),
+        ('workouts by_difficulty', f'/api/workouts/by_difficulty/?difficulty={ids["difficulty"]}'),
+        ('workouts search', '/api/workouts/search/?q=strength'),
+        ('leaderboard list', '/api/leaderboard/'),
+        ('leaderboard detail', f'/api/leaderboard/{ids["leaderboard_id"]}/'),
+        ('leaderboard top', '/api/leaderboard/top/?limit=10'),
+        ('leaderboard top week', '/api/leaderboard/top/?limit=10&window=week'),
+        ('leaderboard by_team', f'/api/leaderboard/by_team/?team_id={ids["team_id"]}'),
+        ('leaderboard around', f'/api/leaderboard/around/{ids["leaderboard_user_id"]}/?radius=5'),
+    ]
+
+
+def measure(path, counter, requests, warmup=0, client=None):
+    """Time `requests` sequential GETs of `path` and summarize them"""
+    client = client or Client(HTTP_HOST='localhost')
+    for _ in range(warmup):
+        client.get(path)
+
+    latencies = []
+    queries = 0
+    statuses = {}
+    started = time.perf_counter()
+    for _ in range(requests):
+        counter.reset()
+        begin = time.perf_counter()
+        response = client.get(path)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        latencies.append((time.perf_counter() - begin) * 1000)
+        queries += counter.count
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    elapsed = time.perf_counter() - started
+
+    return {
+        'path': path,
+        'requests': requests,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'throughput_rps': round(requests / elapsed, 1) if elapsed else None,
+        'queries_per_request': round(queries / requests, 2),
+        'status_codes': statuses,
+    }
+
+
+def compare(base, head, threshold=0.10, metric='p95_ms'):
+    """
+    Compare two benchmark reports.
+
+    Returns a list of rows (scale, endpoint, base value, head value, relative
+    change, regressed) for every endpoint present in both runs; an endpoint
+    regresses when `metric` grew by more than `threshold`.
+    """
+    base_scales = {scale['label']: scale for scale in base['scales']}
+    rows = []
+    for scale in head['scales']:
+        previous = base_scales.get(scale['label'])
+        if previous is None:
+            continue
+        for name, result in scale['endpoints'].items():
+            before = previous['endpoints'].get(name)
+            if before is None or not before[metric]:
+                continue
+            change = (result[metric] - before[metric]) / before[metric]
+            rows.append((scale['label'], name, before[metric], result[metric], change, change > threshold))
+    return rows
@@ -0,0 +1,85 @@
+"""
+Read-through cache for serialized API payloads and per-collection versions.
+
+Every cache key embeds the current version of the collection it was built
+from. Writes bump that version, which invalidates all payloads derived from
+the collection at once without having to enumerate their keys; the stale
+entries simply age out of the LRU. Only one worker recomputes a missing key
+while the others wait briefly for its result.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+LEADERBOARD = 'leaderboard'
+TEAM_STANDINGS = 'team_standings'
+
+LOCK_TIMEOUT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _cache():
+    return caches[settings.OCTOFIT_CACHE_ALIAS]
+
+
+def _version_key(namespace):
+    return f'octofit:version:{namespace}'
+
+
+def get_version(namespace):
+    """Return the current version of a namespace, starting one if needed"""
+    cache = _cache()
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Invalidate every payload cached under a namespace"""
+    cache = _cache()
+    key = _version_key(namespace)
+    current = cache.get(key) or 0
+    version = max(time.time_ns(), current + 1)
+    cache.set(key, version, None)
+    return version
+
+
+def get_or_compute(namespace, key, compute, timeout=None):
+    """
+    Return the cached value for `key`, computing and storing it on a miss.
+
+    `timeout` defaults to `settings.OCTOFIT_CACHE_TIMEOUT`. Concurrent misses
+    are collapsed: the worker holding the lock computes, the rest poll for
+    its result and only compute themselves if the lock holder is too slow.
+    """
+    cache = _cache()
+    if timeout is None:
+        timeout = settings.OCTOFIT_CACHE_TIMEOUT
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    full_key = f'octofit:{namespace}:{get_version(namespace)}:{digest}'
+
+    value = cache.get(full_key)
+    if value is not None:
+        return value
+
+    lock_key = f'{full_key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(full_key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(full_key)
+        if value is not None:
+            return value
+    return compute()
@@ -0,0 +1,114 @@
+"""
+Conditional GET support for the router viewsets.
+
+ETags are derived from the per-collection version counters kept in `cache`,
+so a matching `If-None-Match` or `If-Modified-Since` is answered with 304
+before anything is serialized. Last-Modified is the latest `updated_at` of
+the data where the collection has one; elsewhere it is the time of the
+collection's last write, as recorded by its version counter.
+
+OCTOFIT_CONDITIONAL_GETS requires a cache shared by every process. The
+counters live in the cache, so with a per-process cache (the default
+LocMemCache) a worker never sees the writes made by other workers or by
+management commands: it would answer 304 for data that has changed, and
+two workers would send different validators for the same data. The
+setting is therefore off unless the cache backend is shared.
+"""
+import calendar
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from pymongo import DESCENDING
+from rest_framework.response import Response
+
+from .cache import get_version
+from .mongo import get_db
+from .perf import timed
+
+
+def _timestamp(value):
+    # Naive values read from MongoDB are UTC
+    return calendar.timegm(value.utctimetuple())
+
+
+class ConditionalGetMixin:
+    """Adds strong ETags and Last-Modified to list and retrieve"""
+
+    @property
+    def collection(self):
+        return self.get_queryset().model._meta.db_table
+
+    def collections(self):
+        """Collections whose changes alter the response; override to add related ones"""
+        return [self.collection]
+
+    def _versions(self):
+        return [get_version(collection) for collection in self.collections()]
+
+    def _has_updated_at(self):
+        try:
+            self.get_queryset().model._meta.get_field('updated_at')
+        except FieldDoesNotExist:
+            return False
+        return len(self.collections()) == 1
+
+    def _list_last_modified(self, versions):
+        """
+        Latest updated_at in the collection, read with its index. Deletes
+        don't move it; they change the ETag, which takes precedence.
+        """
+        if self._has_updated_at():
+            latest = get_db()[self.collection].find_one(
+                {'updated_at': {'$ne': None}}, {'updated_at': 1}, sort=[('updated_at', DESCENDING)]
+            )
+            if latest is not None:
+                return _timestamp(latest['updated_at'])
+        return max(versions) // 10 ** 9
+
+    def _etag(self, *parts):
+        digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+        return f'"{digest}"'
+
+    def _conditional(self, request, etag, last_modified, respond):
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = respond()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list_response(self, request, *args, **kwargs):
+        return super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+
+    def retrieve_response(self, instance):
+        with timed('serialize'):
+            data = self.get_serializer(instance).data
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        if not settings.OCTOFIT_CONDITIONAL_GETS:
+            return self.list_response(request, *args, **kwargs)
+        versions = self._versions()
+        etag = self._etag(self.collection, *versions, request.get_full_path(),
+                          request.accepted_renderer.format)
+        return self._conditional(request, etag, self._list_last_modified(versions),
+                                 lambda: self.list_response(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.OCTOFIT_CONDITIONAL_GETS:
+            return self.retrieve_response(self.get_object())
+        versions = self._versions()
+        instance = self.get_object()
+        modified = getattr(instance, 'updated_at', None) or getattr(instance, 'created_at', None)
+        etag = self._etag(self.collection, *versions, instance.pk, modified,
+                          request.get_full_path(), request.accepted_renderer.format)
+        updated_at = getattr(instance, 'updated_at', None)
+        if updated_at and self._has_updated_at():
+            last_modified = _timestamp(updated_at)
+        else:
+            last_modified = max(versions) // 10 ** 9
+        return self._conditional(request, etag, last_modified, lambda: self.retrieve_response(instance))
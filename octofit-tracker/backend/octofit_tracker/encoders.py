@@ -0,0 +1,169 @@
+"""
+Precompiled encoders for the fast read path.
+
+An encoder is built once per serializer class from its declared fields and
+turns raw documents (dicts fetched with a projection) into exactly what
+`serializer.data` would return, without instantiating models or walking
+DRF's field machinery per row.
+"""
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.encoding import is_protected_type
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .perf import timed
+from .serializers import requested_fields
+
+_encoders = {}
+
+
+def iso_datetime(value):
+    """Format a datetime the way DRF's DateTimeField does; naive values from MongoDB are UTC"""
+    if value is None:
+        return None
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _model_field(value):
+    # serializers.ModelField falls back to Field.value_to_string(), i.e. str()
+    return value if is_protected_type(value) else str(value)
+
+
+CONVERTERS = {
+    serializers.CharField: str,
+    serializers.EmailField: str,
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+    serializers.BooleanField: bool,
+    serializers.DateTimeField: iso_datetime,
+    serializers.ModelField: _model_field,
+}
+
+
+class DocumentEncoder:
+    def __init__(self, serializer_class, fields=None):
+        self.fields = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if type(field) not in CONVERTERS or '.' in field.source:
+                raise TypeError(f'{serializer_class.__name__}.{name} has no fast encoder')
+            self.fields.append((name, field.source, CONVERTERS[type(field)]))
+        self.sources = [source for _, source, _ in self.fields]
+
+    def encode(self, document):
+        row = {}
+        for name, source, convert in self.fields:
+            value = document.get(source)
+            row[name] = None if value is None else convert(value)
+        return row
+
+    def encode_many(self, documents):
+        encode = self.encode
+        with timed('serialize'):
+            return [encode(document) for document in documents]
+
+
+def get_encoder(serializer_class, fields=None):
+    """
+    Return the cached encoder for a serializer class, narrowed to `fields`
+    when given, or None if the serializer can't be precompiled.
+    """
+    key = (serializer_class, fields)
+    if key not in _encoders:
+        try:
+            _encoders[key] = DocumentEncoder(serializer_class, fields)
+        except TypeError:
+            _encoders[key] = None
+    return _encoders[key]
+
+
+@lru_cache(maxsize=None)
+def readable_fields(serializer_class):
+    """(name, source) of every field a serializer outputs"""
+    return tuple((name, field.source) for name, field in serializer_class().fields.items()
+                 if not field.write_only)
+
+
+def fast_reads_enabled(serializer_class, fields=None):
+    return settings.OCTOFIT_FAST_READS and get_encoder(serializer_class, fields) is not None
+
+
+def model_sources(model, sources):
+    """The distinct `sources` stored on the model, skipping computed ones"""
+    stored = {field.name for field in model._meta.concrete_fields}
+    return [source for source in dict.fromkeys(sources) if source in stored]
+
+
+def read_rows(queryset, serializer_class, fields=None):
+    """
+    Narrow a queryset for reading: projected dicts on the fast read path,
+    otherwise `.only()` the selected fields. The primary key and ordering
+    fields are always fetched since pagination reads them.
+    """
+    model = queryset.model
+    keys = [model._meta.pk.name] + [name.lstrip('-') for name in model._meta.ordering]
+    if fast_reads_enabled(serializer_class, fields):
+        sources = get_encoder(serializer_class, fields).sources
+        return queryset.values(*model_sources(model, sources + keys))
+    if fields is not None:
+        sources = [source for name, source in readable_fields(serializer_class) if name in fields]
+        return queryset.only(*model_sources(model, sources + keys))
+    return queryset
+
+
+def serialize_rows(rows, serializer_class, context=None, fields=None):
+    """Serialize rows obtained through `read_rows`"""
+    with timed('serialize'):
+        if fast_reads_enabled(serializer_class, fields):
+            return get_encoder(serializer_class, fields).encode_many(rows)
+        return serializer_class(rows, many=True, context=context or {}).data
+
+
+class FastReadMixin:
+    """
+    Serves list() and custom list actions through `read_rows`/`serialize_rows`,
+    so `?fields=`/`?exclude=` narrow the projection and the fast read path
+    applies when enabled.
+    """
+
+    def selected_fields(self, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        names = [name for name, _ in readable_fields(serializer_class)]
+        return requested_fields(self.request, names)
+
+    def read_rows(self, queryset, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        return read_rows(queryset, serializer_class, self.selected_fields(serializer_class))
+
+    def annotate_rows(self, rows):
+        """Hook to set computed values on fetched rows before they are serialized"""
+        return rows
+
+    def serialize_rows(self, rows, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        return serialize_rows(self.annotate_rows(rows), serializer_class, self.get_serializer_context(),
+                              self.selected_fields(serializer_class))
+
+    def narrow_rows(self, rows, serializer_class=None):
+        """Apply `?fields=`/`?exclude=` to already serialized rows (e.g. cached payloads)"""
+        fields = self.selected_fields(serializer_class)
+        if fields is None:
+            return rows
+        return [{name: value for name, value in row.items() if name in fields} for row in rows]
+
+    def list(self, request, *args, **kwargs):
+        rows = self.read_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.serialize_rows(page))
+        return Response(self.serialize_rows(rows))
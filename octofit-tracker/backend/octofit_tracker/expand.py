@@ -0,0 +1,75 @@
+"""
+Inline expansion of related documents with `?expand=`.
+
+Teams can embed their members and their leaderboard standings. Both are
+joined server-side with `$lookup` in the same aggregation that reads the
+teams, so a page of expanded teams costs one round trip instead of one
+request per team.
+"""
+from pymongo import ASCENDING
+
+from . import ranks
+from .encoders import get_encoder
+from .mongo import get_db
+from .serializers import TeamSerializer
+
+TEAM_EXPANSIONS = ('members', 'leaderboard')
+
+# Lightweight summaries embedded in expanded teams
+MEMBER_SUMMARY = {'_id': 1, 'name': 1}
+STANDING_SUMMARY = {'_id': 0, 'user_id': 1, 'user_name': 1, 'total_activities': 1,
+                    'total_calories': 1}
+
+
+def parse_expand(request, allowed):
+    """Return the expansions requested with `?expand=`; ValueError on unknown names"""
+    names = frozenset(name for name in request.query_params.get('expand', '').split(',') if name)
+    unknown = names - set(allowed)
+    if unknown:
+        raise ValueError(f'expand must be a comma-separated subset of: {", ".join(allowed)}')
+    return names
+
+
+def team_pipeline(match, expand, sources):
+    pipeline = [{'$match': match}, {'$sort': {'name': ASCENDING}}]
+    projection = dict.fromkeys(sources, 1)
+    if 'members' in expand:
+        # Matches /teams/{id}/members/: users are linked by their team_id
+        pipeline.append({'$lookup': {
+            'from': 'users',
+            'localField': '_id',
+            'foreignField': 'team_id',
+            'pipeline': [{'$sort': {'name': ASCENDING}}, {'$project': MEMBER_SUMMARY}],
+            'as': 'members',
+        }})
+        projection['members'] = 1
+    if 'leaderboard' in expand:
+        pipeline.append({'$lookup': {
+            'from': 'leaderboard',
+            'localField': '_id',
+            'foreignField': 'team_id',
+            'pipeline': [{'$sort': dict(ranks.LEADERBOARD_ORDER)}, {'$project': STANDING_SUMMARY}],
+            'as': 'leaderboard',
+        }})
+        projection['leaderboard'] = 1
+    pipeline.append({'$project': projection})
+    return pipeline
+
+
+def expanded_teams(match, expand, fields=None, db=None):
+    """
+    Teams matching `match` as TeamSerializer output (narrowed to `fields`)
+    with the requested expansions embedded. Embedded standings are ranked
+    together with one rank lookup.
+    """
+    db = db if db is not None else get_db()
+    encoder = get_encoder(TeamSerializer, fields)
+    rows = []
+    for document in db.teams.aggregate(team_pipeline(match, expand, encoder.sources)):
+        row = encoder.encode(document)
+        for name in expand:
+            row[name] = document[name]
+        rows.append(row)
+    if 'leaderboard' in expand:
+        ranks.annotate([standing for row in rows for standing in row['leaderboard']], db=db)
+    return rows
@@ -0,0 +1,53 @@
+"""
+Streaming activity export.
+
+Rows are read from a server-side MongoDB cursor in batches and encoded one
+at a time, so memory stays bounded and the first byte goes out as soon as
+the first batch arrives.
+"""
+import csv
+import json
+
+from .encoders import get_encoder
+from .indexes import ACTIVITY_ORDER
+from .mongo import get_db
+from .serializers import ActivitySerializer
+
+ENCODER = get_encoder(ActivitySerializer)
+EXPORT_FIELDS = [name for name, _, _ in ENCODER.fields]
+
+
+def activity_rows(user_id=None, since=None, batch_size=1000, db=None):
+    """Yield activities newest first as serializer-shaped dicts"""
+    db = db if db is not None else get_db()
+    query = {}
+    if user_id:
+        query['user_id'] = user_id
+    if since:
+        query['date'] = {'$gte': since}
+    projection = {source: 1 for source in ENCODER.sources}
+    cursor = db.activities.find(query, projection).sort(ACTIVITY_ORDER).batch_size(batch_size)
+    try:
+        for document in cursor:
+            yield ENCODER.encode(document)
+    finally:
+        cursor.close()
+
+
+def ndjson_stream(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() returns the value for csv.writer to hand back"""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
@@ -0,0 +1,166 @@
+"""
+Declarative MongoDB indexes.
+
+`INDEXES` lists the indexes each collection needs to serve the models'
+`Meta.ordering` and the viewset filters, and `QUERY_SHAPES` lists the query
+each endpoint issues so the plans can be checked against them.
+"""
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+from .ranks import LEADERBOARD_ORDER, around_queries
+from .search import WEIGHTS
+
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], unique=True),
+        IndexModel([('name', ASCENDING)]),
+        IndexModel([('team_id', ASCENDING), ('name', ASCENDING)]),
+    ],
+    'teams': [
+        IndexModel([('name', ASCENDING)]),
+    ],
+    'activities': [
+        IndexModel([('date', DESCENDING), ('_id', ASCENDING)]),
+        IndexModel([('user_id', ASCENDING), ('date', DESCENDING), ('_id', ASCENDING)]),
+        IndexModel([('type', ASCENDING), ('date', DESCENDING), ('_id', ASCENDING)]),
+    ],
+    'workouts': [
+        IndexModel([('difficulty', ASCENDING), ('name', ASCENDING)]),
+    ],
+    'leaderboard': [
+        IndexModel(LEADERBOARD_ORDER),
+        IndexModel([('team_id', ASCENDING)] + LEADERBOARD_ORDER),
+        IndexModel([('user_id', ASCENDING)], unique=True),
+        IndexModel([('updated_at', DESCENDING)]),
+    ],
+    'team_standings': [
+        IndexModel([('rank', ASCENDING)]),
+    ],
+    'activity_rollups': [
+        IndexModel([('user_id', ASCENDING), ('day', ASCENDING)]),
+    ],
+    'workout_search': [
+        IndexModel([(field, TEXT) for field in WEIGHTS], weights=WEIGHTS, name='workout_search_text'),
+        IndexModel([('muscles', ASCENDING), ('name', ASCENDING)]),
+        IndexModel([('equipment', ASCENDING), ('name', ASCENDING)]),
+        IndexModel([('duration_minutes', ASCENDING)]),
+        IndexModel([('updated_at', DESCENDING)]),
+    ],
+    'leaderboard_windows': [
+        IndexModel([('window', ASCENDING), ('start', ASCENDING)] + LEADERBOARD_ORDER),
+        IndexModel([('window', ASCENDING), ('start', ASCENDING), ('team_id', ASCENDING)] + LEADERBOARD_ORDER),
+        # Drops each week or month once it is over
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    'leaderboard_window_ranks': [
+        # Rank trees expire with their window
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+ACTIVITY_ORDER = [('date', DESCENDING), ('_id', ASCENDING)]
+_ABOVE, _BELOW = around_queries({'total_calories': 0, '_id': 'sample'})
+_WINDOW = {'window': 'week', 'start': datetime(1970, 1, 5)}
+
+# (endpoint, collection, filter, sort) for every query the API issues
+QUERY_SHAPES = [
+    ('users list', 'users', {}, [('name', ASCENDING)]),
+    ('users detail', 'users', {'_id': 'sample'}, None),
+    ('teams members', 'users', {'team_id': 'sample'}, [('name', ASCENDING)]),
+    ('teams list', 'teams', {}, [('name', ASCENDING)]),
+    ('activities list', 'activities', {}, ACTIVITY_ORDER),
+    ('activities by_user', 'activities', {'user_id': 'sample'}, ACTIVITY_ORDER),
+    ('activities by_type', 'activities', {'type': 'sample'}, ACTIVITY_ORDER),
+    ('users activities', 'activities', {'user_id': 'sample'}, [('date', DESCENDING)]),
+    ('users stats', 'activities', {'user_id': 'sample', 'date': {'$gte': datetime(1970, 1, 1)}}, None),
+    ('users recommended_workouts', 'workout_recommendations', {'_id': 'sample'}, None),
+    ('users activity_summary', 'activity_rollups',
+     {'user_id': 'sample', 'day': {'$gte': datetime(1970, 1, 1)}}, None),
+    ('workouts list', 'workouts', {}, [('difficulty', ASCENDING), ('name', ASCENDING)]),
+    ('workouts by_difficulty', 'workouts', {'difficulty': 'sample'}, [('name', ASCENDING)]),
+    ('workouts search', 'workout_search', {'$text': {'$search': 'sample'}}, None),
+    ('workouts search by muscle', 'workout_search', {'muscles': 'sample'}, [('name', ASCENDING)]),
+    ('workouts search by equipment', 'workout_search', {'equipment': 'sample'}, [('name', ASCENDING)]),
+    ('workouts catalog version', 'workout_search', {}, [('updated_at', DESCENDING)]),
+    ('teams ranking', 'team_standings', {}, [('rank', ASCENDING)]),
+    ('leaderboard list', 'leaderboard', {}, LEADERBOARD_ORDER),
+    ('leaderboard by_team', 'leaderboard', {'team_id': 'sample'}, LEADERBOARD_ORDER),
+    ('leaderboard entry', 'leaderboard', {'user_id': 'sample'}, None),
+    ('leaderboard last modified', 'leaderboard', {'updated_at': {'$ne': None}}, [('updated_at', DESCENDING)]),
+    ('leaderboard around above', 'leaderboard', _ABOVE,
+     [(field, -direction) for field, direction in LEADERBOARD_ORDER]),
+    ('leaderboard around below', 'leaderboard', _BELOW, LEADERBOARD_ORDER),
+    ('leaderboard top window', 'leaderboard_windows', _WINDOW, LEADERBOARD_ORDER),
+    ('leaderboard by_team window', 'leaderboard_windows', dict(_WINDOW, team_id='sample'), LEADERBOARD_ORDER),
+]
+
+
+def _key(spec, weights=None):
+    """
+    Normalize an index key pattern (SON or list of pairs) for comparison. Text
+    indexes are stored as `_fts`/`_ftsx` keys with the fields in `weights`, so
+    their text fields are compared as a set.
+    """
+    pairs = spec.items() if hasattr(spec, 'items') else spec
+    pairs = [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+             for field, direction in pairs]
+    if not any(direction == TEXT for _, direction in pairs):
+        return tuple(pairs)
+    text = tuple(sorted(weights or [field for field, direction in pairs if direction == TEXT]))
+    return tuple(pair for pair in pairs if pair[1] != TEXT and pair[0] != '_ftsx') + ((TEXT, text),)
+
+
+def sync_indexes(db, drop_unknown=False):
+    """
+    Create every declared index that is missing.
+
+    Indexes are matched on their key pattern, so an equivalent index created
+    under another name (e.g. by djongo migrations) is left alone. Returns a
+    dict of collection name to the index names created and, with
+    `drop_unknown`, dropped.
+    """
+    report = {}
+    for collection, models in INDEXES.items():
+        coll = db[collection]
+        existing = {name: _key(info['key'], info.get('weights'))
+                    for name, info in coll.index_information().items()}
+        wanted = {_key(model.document['key']) for model in models}
+        missing = [model for model in models
+                   if _key(model.document['key']) not in existing.values()]
+        created = coll.create_indexes(missing) if missing else []
+        dropped = []
+        if drop_unknown:
+            for name, key in sorted(existing.items()):
+                if name != '_id_' and key not in wanted:
+                    coll.drop_index(name)
+                    dropped.append(name)
+        report[collection] = {'created': created, 'dropped': dropped}
+    return report
+
+
+def plan_stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
+
+
+def check_query_plans(db):
+    """Return (endpoint, stages) for every query shape whose winning plan collection-scans"""
+    failures = []
+    for endpoint, collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = list(plan_stages(winning_plan))
+        if 'COLLSCAN' in stages:
+            failures.append((endpoint, stages))
+    return failures
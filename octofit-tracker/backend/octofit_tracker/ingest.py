@@ -0,0 +1,156 @@
+"""
+Bulk NDJSON ingestion of activities.
+
+Lines are read from the request stream, validated in chunks with the
+activity serializer and written with unordered `insert_many` batches, so a
+bad line or a duplicate `_id` only rejects that line.
+
+Chunked uploads (no Content-Length) are read from the raw input when the
+server provides it whole: ASGI always does, WSGI servers that dechunk the
+body flag it with `wsgi.input_terminated` (gunicorn, uWSGI with
+`--http-chunked-input`). Otherwise `request_lines` returns None and the
+view answers 411 Length Required.
+"""
+import json
+
+from django.core.handlers.asgi import ASGIRequest
+from pymongo.errors import BulkWriteError
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+from . import rollups, standings, windows
+from .cache import bump_version
+from .models import Activity
+from .mongo import get_db
+from .serializers import ActivityBulkSerializer
+
+DUPLICATE_KEY_ERROR = 11000
+MAX_REPORTED_ERRORS = 1000
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def read_lines(stream, block_size=READ_BLOCK_SIZE):
+    """Lines (bytes) of a file-like object read in blocks until it is exhausted"""
+    pending = b''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def request_lines(request):
+    """
+    The lines of a DRF request's body, or None when it has no Content-Length
+    and the server doesn't provide the whole body
+    """
+    if request.META.get('CONTENT_LENGTH'):
+        return request.stream or []
+    if isinstance(request._request, ASGIRequest):
+        # The ASGI handler spools the whole body before the view runs
+        return request._request
+    if request.META.get('wsgi.input_terminated'):
+        return read_lines(request.META['wsgi.input'])
+    # DRF reads no body without a Content-Length, and neither can we
+    return None
+
+
+class ActivityIngest:
+    """Accumulates NDJSON lines and flushes them to MongoDB in chunks"""
+
+    def __init__(self, chunk_size=1000, db=None):
+        self.chunk_size = chunk_size
+        self.db = db if db is not None else get_db()
+        self.serializer = ActivityBulkSerializer()
+        self.defaults = {
+            name: Activity._meta.get_field(name).get_default()
+            for name in ActivityBulkSerializer.Meta.fields
+        }
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self._chunk = []
+
+    def feed(self, lines):
+        """Consume an iterable of raw lines (bytes or str) and flush as chunks fill up"""
+        for line_number, raw in enumerate(lines, start=1):
+            if isinstance(raw, bytes):
+                raw = raw.decode('utf-8', errors='replace')
+            raw = raw.strip()
+            if not raw:
+                continue
+            self.received += 1
+            try:
+                record = json.loads(raw)
+            except ValueError as exc:
+                self._error(line_number, {api_settings.NON_FIELD_ERRORS_KEY: [f'Invalid JSON: {exc}']})
+                continue
+            if not isinstance(record, dict):
+                self._error(line_number, {api_settings.NON_FIELD_ERRORS_KEY: ['Expected a JSON object']})
+                continue
+            self._chunk.append((line_number, record))
+            if len(self._chunk) >= self.chunk_size:
+                self.flush()
+        self.flush()
+        return self
+
+    def flush(self):
+        if not self._chunk:
+            return
+        chunk, self._chunk = self._chunk, []
+
+        line_numbers = []
+        documents = []
+        for line_number, record in chunk:
+            try:
+                validated = self.serializer.run_validation(record)
+            except ValidationError as exc:
+                self._error(line_number, exc.detail)
+                continue
+            document = dict(self.defaults)
+            document.update(validated)
+            line_numbers.append(line_number)
+            documents.append(document)
+        if not documents:
+            return
+
+        rejected = set()
+        try:
+            self.db.activities.insert_many(documents, ordered=False)
+        except BulkWriteError as exc:
+            for write_error in exc.details.get('writeErrors', []):
+                index = write_error['index']
+                rejected.add(index)
+                if write_error.get('code') == DUPLICATE_KEY_ERROR:
+                    detail = {'_id': ['activity with this _id already exists.']}
+                else:
+                    # Not attributable to a field
+                    message = write_error.get('errmsg', 'Write failed')
+                    detail = {api_settings.NON_FIELD_ERRORS_KEY: [f'Row {index} of the batch: {message}']}
+                self._error(line_numbers[index], detail)
+
+        written = [doc for i, doc in enumerate(documents) if i not in rejected]
+        self.inserted += len(written)
+        if written:
+            bump_version(Activity._meta.db_table)
+        standings.apply_activity_inserts(written)
+        rollups.apply_activity_inserts(written, db=self.db)
+        windows.apply_activity_inserts(written, db=self.db)
+
+    def _error(self, line_number, detail):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'errors': detail})
+
+    def summary(self):
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+        }
@@ -0,0 +1,144 @@
+import json
+import platform
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from pymongo import monitoring
+
+from octofit_tracker import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every API endpoint at several dataset scales, or compare two runs'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', default='1000,10000',
+            help='Comma-separated user counts to seed and benchmark (default: 1000,10000)',
+        )
+        parser.add_argument('--teams', type=int, default=10, help='Teams per scale (default: 10)')
+        parser.add_argument(
+            '--activities-per-user', type=int, default=20,
+            help='Activities per user (default: 20)',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument('--workers', type=int, help='populate_db worker processes')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per endpoint')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument(
+            '--skip-seed', action='store_true',
+            help='Benchmark the data already in the database (a single scale)',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Allow seeding the default octofit_db database (it is wiped)',
+        )
+        parser.add_argument(
+            '--compare', nargs=2, metavar=('BASE', 'HEAD'),
+            help='Compare two JSON reports instead of running a benchmark',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.10,
+            help='Relative p95 growth reported as a regression in --compare mode (default: 0.10)',
+        )
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(*options['compare'], threshold=options['threshold'])
+
+        db_name = settings.DATABASES['default']['NAME']
+        if not options['skip_seed'] and db_name == 'octofit_db' and not options['force']:
+            raise CommandError(
+                'Seeding wipes the database; set OCTOFIT_DB_NAME to a scratch database '
+                '(e.g. octofit_bench) or pass --force'
+            )
+        try:
+            scales = [int(value) for value in options['scales'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError('--scales must be a comma-separated list of integers')
+        if options['skip_seed']:
+            scales = [None]
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+
+        # Clients created from now on report their commands to the counter
+        counter = benchmarks.CommandCounter()
+        monitoring.register(counter)
+        connections.close_all()
+
+        report = {
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'database': db_name,
+                'python': platform.python_version(),
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'activities_per_user': options['activities_per_user'],
+                'seed': options['seed'],
+            },
+            'scales': [],
+        }
+        for users in scales:
+            if users is not None:
+                self.stderr.write(f'Seeding {users} users...')
+                seed_options = {
+                    'users': users,
+                    'teams': options['teams'],
+                    'activities_per_user': options['activities_per_user'],
+                    'seed': options['seed'],
+                    'stdout': StringIO(),
+                }
+                if options['workers']:
+                    seed_options['workers'] = options['workers']
+                call_command('populate_db', **seed_options)
+
+            ids = benchmarks.sample_ids()
+            results = {}
+            for name, path in benchmarks.endpoints(ids):
+                results[name] = benchmarks.measure(path, counter, options['requests'], options['warmup'])
+                self.stderr.write(
+                    f'  {name:<24} p50 {results[name]["p50_ms"]:>8.2f} ms  '
+                    f'p95 {results[name]["p95_ms"]:>8.2f} ms  '
+                    f'{results[name]["queries_per_request"]:>5} queries'
+                )
+            report['scales'].append({
+                'label': str(users) if users is not None else 'existing',
+                'users': users,
+                'endpoints': results,
+            })
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def compare(self, base_path, head_path, threshold):
+        try:
+            with open(base_path) as handle:
+                base = json.load(handle)
+            with open(head_path) as handle:
+                head = json.load(handle)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read benchmark reports: {exc}')
+
+        rows = benchmarks.compare(base, head, threshold=threshold)
+        regressions = 0
+        for scale, name, before, after, change, regressed in rows:
+            line = f'{scale:>10} {name:<24} {before:>9.2f} -> {after:>9.2f} ms p95 ({change:+.1%})'
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line + '  REGRESSION'))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(f'{regressions} endpoint(s) regressed by more than {threshold:.0%}')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
@@ -1,15 +1,48 @@
-from django.core.management.base import BaseCommand
-from pymongo import MongoClient
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from datetime import datetime, timedelta
 
+from octofit_tracker import standings, synthetic
+from octofit_tracker.cache import bump_version
+from octofit_tracker.indexes import sync_indexes
+from octofit_tracker.mongo import client_options, get_db
+
 
 class Command(BaseCommand):
-    help = 'Populate the octofit_db database with test data'
+    help = 'Populate the configured database (octofit_db by default) with test data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int,
+            help='Generate this many synthetic users instead of the superhero dataset',
+        )
+        parser.add_argument('--teams', type=int, default=10, help='Synthetic teams (default: 10)')
+        parser.add_argument(
+            '--activities-per-user', type=int, default=20,
+            help='Synthetic activities per user (default: 20)',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes generating and inserting data (default: CPU count)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Documents per unordered insert_many batch (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] is not None:
+            sizes = [options[name] for name in ('users', 'teams', 'workers', 'batch_size')]
+            if min(sizes) < 1 or options['activities_per_user'] < 0:
+                raise CommandError('--users, --teams, --workers and --batch-size must be positive '
+                                   'and --activities-per-user must not be negative')
 
-    def handle(self, *args, **kwargs):
-        # Connect to MongoDB
-        client = MongoClient('localhost', 27017)
-        db = client['octofit_db']
+        # Connect to MongoDB through the shared client
+        db = get_db()
 
         self.stdout.write(self.style.SUCCESS('Connected to MongoDB'))
 
@@ -21,10 +54,120 @@ class Command(BaseCommand):
         db.leaderboard.delete_many({})
         db.workouts.delete_many({})
 
-        # Create unique index on email field for users collection
-        db.users.create_index([("email", 1)], unique=True)
-        self.stdout.write(self.style.SUCCESS('Created unique index on email field'))
+        # Create the declared indexes, including the unique index on email
+        sync_indexes(db)
+        self.stdout.write(self.style.SUCCESS('Created indexes'))
+
+        if options['users'] is None:
+            team_count, user_count, activity_count = self.insert_heroes(db)
+        else:
+            team_count, user_count, activity_count = self.insert_synthetic(db, options)
+
+        # Insert Workouts
+        self.stdout.write('Inserting workouts...')
+        workouts = [
+            {
+                "_id": "workout_beginner_cardio",
+                "name": "Beginner Cardio Blast",
+                "description": "Perfect for getting started with cardio fitness",
+                "difficulty": "Beginner",
+                "duration_minutes": 30,
+                "exercises": [
+                    {"name": "Jumping Jacks", "sets": 3, "reps": 20},
+                    {"name": "High Knees", "sets": 3, "duration_seconds": 30},
+                    {"name": "Burpees", "sets": 3, "reps": 10}
+                ],
+                "target_muscles": ["Legs", "Core", "Cardio"],
+                "equipment_needed": ["None"],
+                "created_at": datetime.now()
+            },
+            {
+                "_id": "workout_strength_upper",
+                "name": "Upper Body Strength",
+                "description": "Build strength in your upper body",
+                "difficulty": "Intermediate",
+                "duration_minutes": 45,
+                "exercises": [
+                    {"name": "Push-ups", "sets": 4, "reps": 15},
+                    {"name": "Pull-ups", "sets": 4, "reps": 8},
+                    {"name": "Dumbbell Press", "sets": 4, "reps": 12}
+                ],
+                "target_muscles": ["Chest", "Back", "Arms", "Shoulders"],
+                "equipment_needed": ["Pull-up bar", "Dumbbells"],
+                "created_at": datetime.now()
+            },
+            {
+                "_id": "workout_hero_training",
+                "name": "Superhero Training",
+                "description": "Train like a superhero with this intense workout",
+                "difficulty": "Advanced",
+                "duration_minutes": 60,
+                "exercises": [
+                    {"name": "Box Jumps", "sets": 5, "reps": 15},
+                    {"name": "Deadlifts", "sets": 5, "reps": 10},
+                    {"name": "Battle Ropes", "sets": 5, "duration_seconds": 45},
+                    {"name": "Plank", "sets": 5, "duration_seconds": 60}
+                ],
+                "target_muscles": ["Full Body"],
+                "equipment_needed": ["Box", "Barbell", "Battle Ropes"],
+                "created_at": datetime.now()
+            },
+            {
+                "_id": "workout_flexibility",
+                "name": "Flexibility and Mobility",
+                "description": "Improve your range of motion and flexibility",
+                "difficulty": "Beginner",
+                "duration_minutes": 30,
+                "exercises": [
+                    {"name": "Cat-Cow Stretch", "sets": 3, "reps": 10},
+                    {"name": "Downward Dog", "sets": 3, "duration_seconds": 30},
+                    {"name": "Hip Flexor Stretch", "sets": 3, "duration_seconds": 45}
+                ],
+                "target_muscles": ["Back", "Hips", "Legs"],
+                "equipment_needed": ["Yoga mat"],
+                "created_at": datetime.now()
+            },
+            {
+                "_id": "workout_speed_agility",
+                "name": "Speed and Agility Training",
+                "description": "Perfect for athletes looking to improve speed",
+                "difficulty": "Advanced",
+                "duration_minutes": 40,
+                "exercises": [
+                    {"name": "Sprint Intervals", "sets": 8, "duration_seconds": 30},
+                    {"name": "Ladder Drills", "sets": 5, "reps": 10},
+                    {"name": "Cone Drills", "sets": 5, "reps": 10}
+                ],
+                "target_muscles": ["Legs", "Core", "Cardio"],
+                "equipment_needed": ["Agility ladder", "Cones"],
+                "created_at": datetime.now()
+            }
+        ]
+        db.workouts.insert_many(workouts)
+        self.stdout.write(self.style.SUCCESS(f'Inserted {len(workouts)} workouts'))
+
+        # Build Leaderboard entries server-side
+        self.stdout.write('Calculating leaderboard...')
+        leaderboard_count = standings.rebuild_leaderboard(db)
+        self.stdout.write(self.style.SUCCESS(f'Inserted {leaderboard_count} leaderboard entries'))
+
+        # Derive the remaining aggregates from the new activities
+        call_command('rebuild_aggregates', only=['team_standings', 'rollups', 'windows', 'workout_search'],
+                     stdout=self.stdout)
 
+        # Invalidate cached payloads and ETags for every collection
+        for collection in ('users', 'teams', 'activities', 'workouts', 'leaderboard'):
+            bump_version(collection)
+
+        self.stdout.write(self.style.SUCCESS('\n=== Database Population Complete ==='))
+        self.stdout.write(self.style.SUCCESS(f'Teams: {team_count}'))
+        self.stdout.write(self.style.SUCCESS(f'Users: {user_count}'))
+        self.stdout.write(self.style.SUCCESS(f'Activities: {activity_count}'))
+        self.stdout.write(self.style.SUCCESS(f'Workouts: {len(workouts)}'))
+        self.stdout.write(self.style.SUCCESS(f'Leaderboard entries: {leaderboard_count}'))
+
+    def insert_heroes(self, db):
+        """Insert the hand-written superhero teams, users and activities"""
         # Insert Teams
         self.stdout.write('Inserting teams...')
         teams = [
@@ -199,125 +342,41 @@ class Command(BaseCommand):
         db.activities.insert_many(activities)
         self.stdout.write(self.style.SUCCESS(f'Inserted {len(activities)} activities'))
 
-        # Insert Workouts
-        self.stdout.write('Inserting workouts...')
-        workouts = [
-            {
-                "_id": "workout_beginner_cardio",
-                "name": "Beginner Cardio Blast",
-                "description": "Perfect for getting started with cardio fitness",
-                "difficulty": "Beginner",
-                "duration_minutes": 30,
-                "exercises": [
-                    {"name": "Jumping Jacks", "sets": 3, "reps": 20},
-                    {"name": "High Knees", "sets": 3, "duration_seconds": 30},
-                    {"name": "Burpees", "sets": 3, "reps": 10}
-                ],
-                "target_muscles": ["Legs", "Core", "Cardio"],
-                "equipment_needed": ["None"],
-                "created_at": datetime.now()
-            },
-            {
-                "_id": "workout_strength_upper",
-                "name": "Upper Body Strength",
-                "description": "Build strength in your upper body",
-                "difficulty": "Intermediate",
-                "duration_minutes": 45,
-                "exercises": [
-                    {"name": "Push-ups", "sets": 4, "reps": 15},
-                    {"name": "Pull-ups", "sets": 4, "reps": 8},
-                    {"name": "Dumbbell Press", "sets": 4, "reps": 12}
-                ],
-                "target_muscles": ["Chest", "Back", "Arms", "Shoulders"],
-                "equipment_needed": ["Pull-up bar", "Dumbbells"],
-                "created_at": datetime.now()
-            },
-            {
-                "_id": "workout_hero_training",
-                "name": "Superhero Training",
-                "description": "Train like a superhero with this intense workout",
-                "difficulty": "Advanced",
-                "duration_minutes": 60,
-                "exercises": [
-                    {"name": "Box Jumps", "sets": 5, "reps": 15},
-                    {"name": "Deadlifts", "sets": 5, "reps": 10},
-                    {"name": "Battle Ropes", "sets": 5, "duration_seconds": 45},
-                    {"name": "Plank", "sets": 5, "duration_seconds": 60}
-                ],
-                "target_muscles": ["Full Body"],
-                "equipment_needed": ["Box", "Barbell", "Battle Ropes"],
-                "created_at": datetime.now()
-            },
-            {
-                "_id": "workout_flexibility",
-                "name": "Flexibility and Mobility",
-                "description": "Improve your range of motion and flexibility",
-                "difficulty": "Beginner",
-                "duration_minutes": 30,
-                "exercises": [
-                    {"name": "Cat-Cow Stretch", "sets": 3, "reps": 10},
-                    {"name": "Downward Dog", "sets": 3, "duration_seconds": 30},
-                    {"name": "Hip Flexor Stretch", "sets": 3, "duration_seconds": 45}
-                ],
-                "target_muscles": ["Back", "Hips", "Legs"],
-                "equipment_needed": ["Yoga mat"],
-                "created_at": datetime.now()
-            },
-            {
-                "_id": "workout_speed_agility",
-                "name": "Speed and Agility Training",
-                "description": "Perfect for athletes looking to improve speed",
-                "difficulty": "Advanced",
-                "duration_minutes": 40,
-                "exercises": [
-                    {"name": "Sprint Intervals", "sets": 8, "duration_seconds": 30},
-                    {"name": "Ladder Drills", "sets": 5, "reps": 10},
-                    {"name": "Cone Drills", "sets": 5, "reps": 10}
-                ],
-                "target_muscles": ["Legs", "Core", "Cardio"],
-                "equipment_needed": ["Agility ladder", "Cones"],
-                "created_at": datetime.now()
-            }
-        ]
-        db.workouts.insert_many(workouts)
-        self.stdout.write(self.style.SUCCESS(f'Inserted {len(workouts)} workouts'))
+        return len(teams), len(users), len(activities)
 
-        # Calculate and insert Leaderboard entries
-        self.stdout.write('Calculating leaderboard...')
-        leaderboard_entries = []
-        
-        for user in users:
-            user_activities = [a for a in activities if a['user_id'] == user['_id']]
-            total_calories = sum(a['calories_burned'] for a in user_activities)
-            total_duration = sum(a['duration_minutes'] for a in user_activities)
-            total_activities = len(user_activities)
-            
-            leaderboard_entries.append({
-                "_id": f"leaderboard_{user['_id']}",
-                "user_id": user['_id'],
-                "user_name": user['name'],
-                "team_id": user['team_id'],
-                "total_activities": total_activities,
-                "total_calories": total_calories,
-                "total_duration_minutes": total_duration,
-                "rank": 0,  # Will be updated after sorting
-                "updated_at": datetime.now()
-            })
-        
-        # Sort by total calories and assign ranks
-        leaderboard_entries.sort(key=lambda x: x['total_calories'], reverse=True)
-        for i, entry in enumerate(leaderboard_entries):
-            entry['rank'] = i + 1
-        
-        db.leaderboard.insert_many(leaderboard_entries)
-        self.stdout.write(self.style.SUCCESS(f'Inserted {len(leaderboard_entries)} leaderboard entries'))
+    def insert_synthetic(self, db, options):
+        """Generate users and activities in parallel worker processes"""
+        now = synthetic.anchor_time()
+        self.stdout.write(f'Inserting {options["teams"]} teams...')
+        teams = synthetic.team_documents(options['teams'], options['seed'], now)
+        db.teams.insert_many(teams, ordered=False)
+        team_ids = [team['_id'] for team in teams]
 
-        # Close connection
-        client.close()
+        total = options['users']
+        workers = min(options['workers'], total)
+        # Several ranges per worker keep the pool busy until the end
+        step = max(1, min(10000, -(-total // (workers * 4))))
+        # Workers can't share this process's pool; they open their own client with the same options
+        tasks = [
+            (client_options(), db.name, start, min(start + step, total), team_ids,
+             options['activities_per_user'], options['seed'], options['batch_size'], now)
+            for start in range(0, total, step)
+        ]
+        self.stdout.write(
+            f'Generating {total} users x {options["activities_per_user"]} activities '
+            f'with {workers} worker(s)...'
+        )
+        user_count = activity_count = 0
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            run = pool.map if pool else map
+            for users, activities in run(synthetic.populate_range, tasks):
+                user_count += users
+                activity_count += activities
+        finally:
+            if pool:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Inserted {user_count} users and {activity_count} activities'))
 
-        self.stdout.write(self.style.SUCCESS('\n=== Database Population Complete ==='))
-        self.stdout.write(self.style.SUCCESS(f'Teams: {len(teams)}'))
-        self.stdout.write(self.style.SUCCESS(f'Users: {len(users)}'))
-        self.stdout.write(self.style.SUCCESS(f'Activities: {len(activities)}'))
-        self.stdout.write(self.style.SUCCESS(f'Workouts: {len(workouts)}'))
-        self.stdout.write(self.style.SUCCESS(f'Leaderboard entries: {len(leaderboard_entries)}'))
+        synthetic.link_team_members(db)
+        return len(teams), user_count, activity_count
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from pymongo.errors import PyMongoError
+
+from octofit_tracker import snapshots
+
+
+class Command(BaseCommand):
+    help = 'Publish precompressed leaderboard snapshots, once or every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=settings.OCTOFIT_SNAPSHOT_INTERVAL,
+            help='Seconds between publishes (default: OCTOFIT_SNAPSHOT_INTERVAL)',
+        )
+        parser.add_argument('--once', action='store_true', help='Publish a single snapshot and exit')
+        parser.add_argument(
+            '--limit', type=int, default=settings.OCTOFIT_SNAPSHOT_TOP_N,
+            help='Entries in the top snapshot (default: OCTOFIT_SNAPSHOT_TOP_N)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            try:
+                meta = snapshots.publish(limit=options['limit'])
+            except (DatabaseError, PyMongoError) as exc:
+                if options['once']:
+                    raise CommandError(f'Publish failed: {exc}')
+                # Keep serving the previous snapshot and try again next interval
+                self.stderr.write(f'Publish failed: {exc}')
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Published {meta["snapshots"]} snapshots ({meta["generated_at"]})'
+                ))
+            if options['once']:
+                return
+            time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import rollups, search, standings, windows
+from octofit_tracker.mongo import get_db
+
+# name: rebuild function returning the number of documents written
+AGGREGATES = {
+    'leaderboard': standings.rebuild_leaderboard,
+    # Derived from the leaderboard, so rebuilt after it
+    'team_standings': standings.rebuild_team_standings,
+    'rollups': rollups.rebuild_rollups,
+    # Derived from the rollups, so rebuilt after them
+    'windows': windows.rebuild_windows,
+    'workout_search': search.rebuild_search,
+}
+
+
+class Command(BaseCommand):
+    help = 'Recompute the incrementally maintained aggregates and search documents from their source collections'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only', action='append', choices=list(AGGREGATES),
+            help='Rebuild only this aggregate (repeatable; default: all)',
+        )
+
+    def handle(self, *args, **options):
+        db = get_db()
+        for name in options['only'] or AGGREGATES:
+            self.stdout.write(f'Rebuilding {name}...')
+            count = AGGREGATES[name](db)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {count} {name} documents'))
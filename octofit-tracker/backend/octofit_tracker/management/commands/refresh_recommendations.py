@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute every user\'s recommended workouts (run nightly)'
+
+    def handle(self, *args, **options):
+        if not recommendations.available():
+            raise CommandError('Recommendations need NumPy: pip install numpy')
+        started = time.monotonic()
+        count = recommendations.refresh_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed recommendations for {count} users in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker.indexes import check_query_plans, sync_indexes
+from octofit_tracker.mongo import get_db
+
+
+class Command(BaseCommand):
+    help = 'Create the declared MongoDB indexes and verify endpoint query plans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only explain() each endpoint query shape and fail on any COLLSCAN',
+        )
+        parser.add_argument(
+            '--drop-unknown', action='store_true',
+            help='Drop indexes that are not declared in octofit_tracker.indexes',
+        )
+
+    def handle(self, *args, **options):
+        db = get_db()
+
+        if not options['check']:
+            report = sync_indexes(db, drop_unknown=options['drop_unknown'])
+            for collection, changes in report.items():
+                for name in changes['created']:
+                    self.stdout.write(self.style.SUCCESS(f'Created index {collection}.{name}'))
+                for name in changes['dropped']:
+                    self.stdout.write(self.style.WARNING(f'Dropped index {collection}.{name}'))
+            self.stdout.write(self.style.SUCCESS('Indexes are in sync'))
+            return
+
+        failures = check_query_plans(db)
+        for endpoint, stages in failures:
+            self.stderr.write(self.style.ERROR(f'{endpoint}: COLLSCAN ({" > ".join(stages)})'))
+        if failures:
+            raise CommandError(f'{len(failures)} query shape(s) scan a whole collection')
+        self.stdout.write(self.style.SUCCESS('All endpoint query shapes use an index'))
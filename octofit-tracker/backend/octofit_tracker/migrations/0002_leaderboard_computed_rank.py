@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-18 15:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='leaderboard',
+            options={'ordering': ['-total_calories', '_id']},
+        ),
+        migrations.RemoveField(
+            model_name='leaderboard',
+            name='rank',
+        ),
+    ]
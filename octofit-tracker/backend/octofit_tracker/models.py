@@ -78,12 +78,12 @@ class Leaderboard(models.Model):
     total_activities = models.IntegerField(default=0)
     total_calories = models.IntegerField(default=0)
     total_duration_minutes = models.IntegerField(default=0)
-    rank = models.IntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'leaderboard'
-        ordering = ['rank']
+        # Rank order; ranks themselves are computed on demand by `ranks`
+        ordering = ['-total_calories', '_id']
 
     def __str__(self):
-        return f"{self.user_name} - Rank {self.rank}"
+        return f"{self.user_name} - {self.total_calories} calories"
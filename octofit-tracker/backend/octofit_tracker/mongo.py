@@ -0,0 +1,150 @@
+"""
+MongoDB client access.
+
+The native pymongo paths (repository reads, standings, ranks, windows,
+management commands and jobs) share one lock-guarded, process-wide
+`MongoClient` built from `DATABASES['default']['CLIENT']`, so the pool
+settings bound the connections the process opens. djongo keeps its own
+client per thread-local Django connection for ORM queries. Processes or
+event loops that can't share the client (populate_db workers, Motor) build
+their own from the same options with `client_options()`.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from pymongo import MongoClient, monitoring
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters for every client in the process: connections
+    open and checked out, and how long checkouts waited for a connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'open': self.open,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'checkout_wait_ms_total': round(self.wait_total * 1000, 3),
+                'checkout_wait_ms_mean': round(self.wait_total * 1000 / self.checkouts, 3)
+                if self.checkouts else 0.0,
+                'checkout_wait_ms_max': round(self.wait_max * 1000, 3),
+            }
+
+    def _waited(self):
+        started = getattr(self._started, 'value', None)
+        self._started.value = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._started.value = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = self._waited()
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def connection_check_out_failed(self, event):
+        self._waited()
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+pool_stats = PoolStats()
+# Applies to every client created after import, djongo's and Motor's included
+monitoring.register(pool_stats)
+
+
+def client_options(**overrides):
+    """MongoClient keyword arguments from settings, with `overrides` applied"""
+    options = dict(settings.DATABASES['default'].get('CLIENT', {}))
+    options.update(overrides)
+    return options
+
+
+def new_client(options=None):
+    """A dedicated client, e.g. for a worker process; the caller closes it"""
+    return MongoClient(**(options if options is not None else client_options()))
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide client, creating it on first use"""
+    global _client, _client_pid
+    # A forked child must not reuse the parent's sockets
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = new_client()
+                _client_pid = os.getpid()
+    return _client
+
+
+def close_client():
+    """Close the process-wide client; the next get_client() opens a new one"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def get_db():
+    """Return the default database on the process-wide client"""
+    # settings_dict follows the test runner's switch to the test database
+    return get_client()[connection.settings_dict['NAME']]
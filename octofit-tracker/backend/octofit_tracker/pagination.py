@@ -0,0 +1,161 @@
+import base64
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on a datetime field plus `_id` as a tiebreaker.
+
+    Each page is fetched with a range filter on the sort key instead of an
+    OFFSET, so djongo never has to skip() over the pages before it.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    ordering_field = 'date'
+    tiebreaker_field = '_id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        def fetch(position, reverse, limit):
+            rows = queryset
+            if position is not None:
+                rows = rows.filter(self.position_filter(position, reverse))
+            if reverse:
+                rows = rows.order_by(self.ordering_field, '-' + self.tiebreaker_field)
+            else:
+                rows = rows.order_by('-' + self.ordering_field, self.tiebreaker_field)
+            return list(rows[:limit])
+        return self.paginate(fetch, request)
+
+    def paginate(self, fetch, request):
+        """
+        Paginate rows returned by `fetch(position, reverse, limit)`, which must
+        return up to `limit` rows strictly after `position` in scan order.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        position, reverse = self.decode_cursor(request)
+        # Fetch one extra row to find out whether there is a further page
+        results = fetch(position, reverse, self.page_size + 1)
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.first = self.get_position(results[0]) if results else None
+        self.last = self.get_position(results[-1]) if results else None
+        if not results and position is not None:
+            # Empty page reached through a cursor: allow stepping back
+            self.first = self.last = position
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
+
+    def get_position(self, obj):
+        """Return the (ordering value, tiebreaker) pair of a result row"""
+        if isinstance(obj, dict):
+            return obj[self.ordering_field], obj[self.tiebreaker_field]
+        return getattr(obj, self.ordering_field), getattr(obj, self.tiebreaker_field)
+
+    def position_filter(self, position, reverse):
+        """Rows strictly after `position` in the requested direction"""
+        value, tiebreaker = position
+        if reverse:
+            return (Q(**{f'{self.ordering_field}__gt': value}) |
+                    Q(**{self.ordering_field: value, f'{self.tiebreaker_field}__lt': tiebreaker}))
+        return (Q(**{f'{self.ordering_field}__lt': value}) |
+                Q(**{self.ordering_field: value, f'{self.tiebreaker_field}__gt': tiebreaker}))
+
+    def position_query(self, position, reverse, columns=None):
+        """MongoDB equivalent of `position_filter`, on the given (ordering, tiebreaker) columns"""
+        value, tiebreaker = position
+        ordering, tie = columns or (self.ordering_field, self.tiebreaker_field)
+        before, after = ('$gt', '$lt') if reverse else ('$lt', '$gt')
+        return {'$or': [{ordering: {before: value}}, {ordering: value, tie: {after: tiebreaker}}]}
+
+    def encode_cursor(self, position, reverse):
+        value, tiebreaker = position
+        if timezone.is_naive(value):
+            # Rows read natively from MongoDB carry naive UTC datetimes
+            value = timezone.make_aware(value, dt_timezone.utc)
+        payload = {'v': value.isoformat(), 't': tiebreaker}
+        if reverse:
+            payload['r'] = 1
+        token = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii').rstrip('=')
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            position = (datetime.fromisoformat(payload['v']), str(payload['t']))
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+
+class ActivityCursorPagination(KeysetPagination):
+    """
+    Activities newest first, matching `Activity.Meta.ordering`. Responses
+    are {next, previous, results} pages rather than a bare list.
+    """
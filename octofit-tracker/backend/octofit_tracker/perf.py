@@ -0,0 +1,235 @@
+"""
+Per-request performance instrumentation.
+
+`PerformanceMiddleware` breaks every request down into MongoDB time (from a
+pymongo command listener, so djongo's queries and the native paths are
+both counted), serialization and rendering, and reports it in a
+`Server-Timing` header. A sample of requests is also written to a rotating
+JSONL file, tagged with the viewset and action that served it. The
+middleware is sync and async capable, so async views stay on the event
+loop under ASGI. Peak Python allocation is only traced when
+OCTOFIT_PERF_TRACE_MEMORY is on, for single-threaded sync servers.
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from pymongo import monitoring
+
+_current = contextvars.ContextVar('octofit_perf_record', default=None)
+
+
+class RequestRecord:
+    """Timings accumulated while serving one request"""
+
+    def __init__(self):
+        self.view = None
+        self.action = None
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.timings = {}
+        self._active = set()
+        self._db_waits = 0
+        self._render_started = None
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Adds each MongoDB command's duration to the record of the request that issued it"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        record = _current.get()
+        # Awaited Motor calls are timed by db_wait() instead
+        if record is not None and not record._db_waits:
+            record.db_queries += 1
+            record.db_time += event.duration_micros / 1e6
+
+
+# Applies to every client created after import, djongo's included
+monitoring.register(CommandTimer())
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block, minus MongoDB time, to the current
+    request's `name` timing. Nested blocks with the same name count once.
+    """
+    record = _current.get()
+    if record is None or name in record._active:
+        yield
+        return
+    record._active.add(name)
+    db_time = record.db_time
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record._active.discard(name)
+        elapsed = time.perf_counter() - started - (record.db_time - db_time)
+        record.timings[name] = record.timings.get(name, 0.0) + max(elapsed, 0.0)
+
+
+@contextmanager
+def db_wait():
+    """
+    Count an awaited Motor operation as one query and its wall time as
+    MongoDB time. Motor runs commands on executor threads, which don't
+    reliably see the request's record, so the listener skips them here.
+    """
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    record._db_waits += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record._db_waits -= 1
+        record.db_queries += 1
+        record.db_time += time.perf_counter() - started
+
+
+def server_timing(record, total):
+    metrics = [f'db;desc="{record.db_queries} queries";dur={record.db_time * 1000:.3f}']
+    for name in ('serialize', 'render'):
+        if name in record.timings:
+            metrics.append(f'{name};dur={record.timings[name] * 1000:.3f}')
+    metrics.append(f'total;dur={total * 1000:.3f}')
+    return ', '.join(metrics)
+
+
+def view_tags(view_func, request):
+    """(viewset or view name, action) for a resolved view"""
+    cls = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None)
+    if cls is not None and actions:
+        return cls.__name__, actions.get(request.method.lower())
+    if cls is not None and cls.__name__ != 'WrappedAPIView':
+        return cls.__name__, request.method.lower()
+    return getattr(view_func, '__name__', type(view_func).__name__), request.method.lower()
+
+
+class PerformanceMiddleware:
+    """Server-Timing for every request, JSONL records for a sample of them"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.OCTOFIT_PERF_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            # Native in both modes, so ASGI never hops async views to a thread
+            markcoroutinefunction(self)
+            self.process_template_response = self.aprocess_template_response
+        self.sample_rate = settings.OCTOFIT_PERF_SAMPLE_RATE
+        # tracemalloc is process-wide: concurrent requests would mix their
+        # allocations and stop each other's tracing
+        self.trace_memory = settings.OCTOFIT_PERF_TRACE_MEMORY and not self.is_async
+        self.handler = None
+        if self.sample_rate > 0:
+            path = os.path.abspath(settings.OCTOFIT_PERF_LOG)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.handler = RotatingFileHandler(
+                path, maxBytes=settings.OCTOFIT_PERF_LOG_MAX_BYTES,
+                backupCount=settings.OCTOFIT_PERF_LOG_BACKUPS, delay=True,
+            )
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        sampled = self._sampled()
+        trace_memory = sampled and self.trace_memory and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        record = RequestRecord()
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            _current.reset(token)
+            peak = None
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        return self._finish(request, response, record, total, sampled, peak)
+
+    async def __acall__(self, request):
+        sampled = self._sampled()
+        record = RequestRecord()
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            _current.reset(token)
+        return self._finish(request, response, record, total, sampled, None)
+
+    def _sampled(self):
+        return self.handler is not None and random.random() < self.sample_rate
+
+    def _finish(self, request, response, record, total, sampled, peak):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            record.view, record.action = view_tags(match.func, request)
+        response['Server-Timing'] = server_timing(record, total)
+        if sampled:
+            self.write(request, response, record, total, peak)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after the last of these hooks
+        record = _current.get()
+        if record is not None:
+            record._render_started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self._rendered(record))
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        return self.process_template_response(request, response)
+
+    def _rendered(self, record):
+        if record._render_started is not None:
+            record.timings['render'] = time.perf_counter() - record._render_started
+
+    def write(self, request, response, record, total, peak):
+        line = json.dumps({
+            'ts': datetime.now(timezone.utc).isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': record.view,
+            'action': record.action,
+            'total_ms': round(total * 1000, 3),
+            'db_queries': record.db_queries,
+            'db_ms': round(record.db_time * 1000, 3),
+            'serialize_ms': round(record.timings.get('serialize', 0.0) * 1000, 3),
+            'render_ms': round(record.timings.get('render', 0.0) * 1000, 3),
+            'peak_alloc_bytes': peak,
+        })
+        self.handler.handle(logging.makeLogRecord({'msg': line, 'levelno': logging.INFO}))
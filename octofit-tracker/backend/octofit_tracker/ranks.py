@@ -0,0 +1,198 @@
+"""
+On-demand leaderboard ranks.
+
+A user's rank is one plus the number of entries with strictly more total
+calories, so tied users share a rank (1, 2, 2, 4) and are listed by `_id`.
+Instead of storing ranks, which one score change can make stale for every
+entry below it, the number of entries per score is kept in a Fenwick tree
+(binary indexed tree) stored in the `leaderboard_ranks` collection: each
+score change `$inc`s at most LEVELS nodes and each rank lookup reads at most
+LEVELS nodes, whatever the number of users. Increments commute, so
+concurrent writers keep the tree exact without locking.
+
+Other boards (see `windows`) keep their own trees, named by `tree`, whose
+node `_id`s are prefixed with the tree's name.
+"""
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from .mongo import get_db
+
+COLLECTION = 'leaderboard_ranks'
+LEVELS = 24
+# Scores are clamped to [0, SIZE - 1]; totals above ~16.7M calories tie
+SIZE = 1 << LEVELS
+
+LEADERBOARD_ORDER = [('total_calories', DESCENDING), ('_id', ASCENDING)]
+
+
+def node_id(node, tree=None):
+    return node if tree is None else f'{tree}|{node}'
+
+
+def _position(score):
+    return min(max(int(score or 0), 0), SIZE - 1) + 1
+
+
+def update_nodes(score):
+    """Tree nodes covering `score`, i.e. those an insertion increments"""
+    i = _position(score)
+    while i <= SIZE:
+        yield i
+        i += i & -i
+
+
+def prefix_nodes(score):
+    """Tree nodes whose counts sum to the number of entries scoring <= `score`"""
+    i = _position(score)
+    while i > 0:
+        yield i
+        i &= i - 1
+
+
+def move_requests(changes, tree=None, on_insert=None):
+    """
+    Bulk $inc requests for (old score or None, new score or None) changes;
+    `on_insert` is set on nodes the requests create
+    """
+    deltas = {}
+    for old, new in changes:
+        if old is not None and new is not None and _position(old) == _position(new):
+            continue
+        for score, sign in ((old, -1), (new, 1)):
+            if score is not None:
+                for node in update_nodes(score):
+                    deltas[node] = deltas.get(node, 0) + sign
+    requests = []
+    for node, delta in deltas.items():
+        if delta:
+            update = {'$inc': {'count': delta}}
+            if on_insert:
+                update['$setOnInsert'] = on_insert
+            requests.append(UpdateOne({'_id': node_id(node, tree)}, update, upsert=True))
+    return requests
+
+
+def move(old=None, new=None, db=None):
+    """Record an entry's score changing from `old` to `new` (None when absent)"""
+    requests = move_requests([(old, new)])
+    if requests:
+        db = db if db is not None else get_db()
+        db[COLLECTION].bulk_write(requests, ordered=False)
+
+
+def rank_query(scores, tree=None):
+    nodes = sorted({SIZE}.union(*(prefix_nodes(score) for score in scores)))
+    return {'_id': {'$in': [node_id(node, tree) for node in nodes]}}
+
+
+def ranks_from_nodes(scores, nodes, tree=None):
+    """{score: rank} from the node documents matched by `rank_query(scores, tree)`"""
+    counts = {node['_id']: node['count'] for node in nodes}
+    total = counts.get(node_id(SIZE, tree), 0)
+    return {score: 1 + total - sum(counts.get(node_id(node, tree), 0) for node in prefix_nodes(score))
+            for score in scores}
+
+
+def ranks_for(scores, db=None, collection=COLLECTION, tree=None):
+    """Rank of each score, read with a single query"""
+    scores = set(scores)
+    if not scores:
+        return {}
+    db = db if db is not None else get_db()
+    return ranks_from_nodes(scores, db[collection].find(rank_query(scores, tree)), tree)
+
+
+def _score(row):
+    return row.get('total_calories') if isinstance(row, dict) else row.total_calories
+
+
+def _set_rank(row, rank):
+    if isinstance(row, dict):
+        row['rank'] = rank
+    else:
+        row.rank = rank
+
+
+def annotate(rows, db=None, collection=COLLECTION, tree=None):
+    """Set `rank` on leaderboard rows (dicts or instances); returns them as a list"""
+    rows = list(rows)
+    ranks = ranks_for((_score(row) for row in rows), db, collection, tree)
+    for row in rows:
+        _set_rank(row, ranks[_score(row)])
+    return rows
+
+
+def annotate_sorted(rows):
+    """
+    Set `rank` on rows read from the very top of a board in leaderboard
+    order, from their positions: no query needed. Returns them as a list.
+    """
+    rows = list(rows)
+    rank, previous = 0, None
+    for position, row in enumerate(rows, start=1):
+        if position == 1 or _score(row) != previous:
+            rank, previous = position, _score(row)
+        _set_rank(row, rank)
+    return rows
+
+
+def around_queries(entry):
+    """(above, below) find filters for the entries ranked right before and after `entry`"""
+    score, pk = entry['total_calories'], entry['_id']
+    above = {'$or': [{'total_calories': {'$gt': score}}, {'total_calories': score, '_id': {'$lt': pk}}]}
+    below = {'$or': [{'total_calories': {'$lt': score}}, {'total_calories': score, '_id': {'$gt': pk}}]}
+    return above, below
+
+
+def around(user_id, radius, projection=None, db=None):
+    """
+    The user's leaderboard entry with up to `radius` neighbours on each side,
+    in leaderboard order, or None when the user has no entry.
+    """
+    db = db if db is not None else get_db()
+    entry = db.leaderboard.find_one({'user_id': user_id}, projection)
+    if entry is None:
+        return None
+    above, below = around_queries(entry)
+    reverse_order = [(field, -direction) for field, direction in LEADERBOARD_ORDER]
+    before = list(db.leaderboard.find(above, projection, sort=reverse_order, limit=radius))
+    after = list(db.leaderboard.find(below, projection, sort=LEADERBOARD_ORDER, limit=radius))
+    return before[::-1] + [entry] + after
+
+
+def tree_nodes(counts):
+    """{node: count} of the tree holding `counts`, an iterable of (score, entries)"""
+    nodes = {}
+    for score, count in counts:
+        for node in update_nodes(score):
+            nodes[node] = nodes.get(node, 0) + count
+    return nodes
+
+
+def rebuild(db=None):
+    """
+    Rebuild the tree from the leaderboard collection. It is built in a
+    scratch collection and swapped in with a rename, so readers never see a
+    partial tree. Returns the number of entries counted.
+    """
+    db = db if db is not None else get_db()
+    counts = db.leaderboard.aggregate([
+        {'$group': {
+            '_id': {'$min': [{'$max': [{'$ifNull': ['$total_calories', 0]}, 0]}, SIZE - 1]},
+            'count': {'$sum': 1},
+        }},
+    ], allowDiskUse=True)
+    counts = [(row['_id'], row['count']) for row in counts]
+    entries = sum(count for _, count in counts)
+    nodes = tree_nodes(counts)
+
+    scratch = db[f'{COLLECTION}_rebuild']
+    scratch.drop()
+    documents = [{'_id': node, 'count': count} for node, count in nodes.items()]
+    for start in range(0, len(documents), 10000):
+        scratch.insert_many(documents[start:start + 10000], ordered=False)
+    if documents:
+        scratch.rename(COLLECTION, dropTarget=True)
+    else:
+        db[COLLECTION].drop()
+    return entries
@@ -0,0 +1,251 @@
+"""
+Workout recommendations.
+
+Every workout is scored for a user on three signals:
+
+- level: how close the workout's difficulty is to the user's
+  `profile.fitness_level`;
+- coverage: how much of the workout targets muscles that the user's recent
+  activities (by type, over the last HISTORY_DAYS days of rollups) have not
+  been training;
+- equipment: workouts that need less equipment score higher.
+
+The catalog is turned into feature matrices once (a row-normalized muscle
+incidence matrix, plus difficulty and equipment vectors), and users are
+scored in chunks with one matrix product per chunk, keeping each user's best
+TOP_N with argpartition. `refresh_all` stores every user's list in the
+`workout_recommendations` collection (`manage.py refresh_recommendations`,
+meant to run nightly), reading users in batches of USER_BATCH. A request
+reads its user's stored list and only scores users that have none yet.
+"""
+import json
+from datetime import timedelta
+from itertools import islice
+
+from django.utils import timezone
+from pymongo import ASCENDING
+
+from . import search
+from .cache import bump_version
+from .mongo import get_db
+from .rollups import day_of
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+COLLECTION = 'workout_recommendations'
+TOP_N = 10
+HISTORY_DAYS = 30
+# Users scored per matrix product, sized to keep a chunk's scores around 16MB
+CHUNK_CELLS = 4_000_000
+# Users loaded, scored and written at a time by refresh_all
+USER_BATCH = 10000
+
+WEIGHTS = {'level': 0.5, 'coverage': 0.35, 'equipment': 0.15}
+LEVELS = {'beginner': 0, 'intermediate': 1, 'advanced': 2, 'expert': 3}
+DEFAULT_LEVEL = 'beginner'
+NO_EQUIPMENT = {'none', ''}
+
+# Muscle groups (as in workouts' target_muscles, lower-cased) each activity type trains
+ACTIVITY_MUSCLES = {
+    'running': ('legs', 'cardio', 'core'),
+    'cycling': ('legs', 'cardio'),
+    'swimming': ('back', 'shoulders', 'arms', 'cardio', 'full body'),
+    'weight training': ('chest', 'back', 'arms', 'shoulders', 'legs'),
+    'yoga': ('core', 'back', 'hips'),
+    'boxing': ('arms', 'shoulders', 'core', 'cardio'),
+}
+
+# Feature matrices of the catalog this process last loaded
+_features = {'version': None, 'features': None}
+
+
+def available():
+    return np is not None
+
+
+def fitness_level(profile):
+    """Index of a user's fitness level; profiles written through the ORM may be JSON strings"""
+    if isinstance(profile, str):
+        try:
+            profile = json.loads(profile)
+        except ValueError:
+            profile = {}
+    level = profile.get('fitness_level') if isinstance(profile, dict) else None
+    return LEVELS.get(str(level or DEFAULT_LEVEL).strip().lower(), 0)
+
+
+class WorkoutFeatures:
+    """Feature matrices of the workout catalog, read from the search documents"""
+
+    def __init__(self, documents):
+        documents = list(documents)
+        self.ids = [document['_id'] for document in documents]
+        self.muscles = sorted({muscle for document in documents for muscle in document['muscles']}
+                              | {muscle for muscles in ACTIVITY_MUSCLES.values() for muscle in muscles})
+        column = {muscle: i for i, muscle in enumerate(self.muscles)}
+
+        self.incidence = np.zeros((len(documents), len(self.muscles)), dtype=np.float32)
+        for row, document in enumerate(documents):
+            for muscle in document['muscles']:
+                self.incidence[row, column[muscle]] = 1.0
+        totals = self.incidence.sum(axis=1, keepdims=True)
+        np.divide(self.incidence, totals, out=self.incidence, where=totals > 0)
+
+        self.difficulty = np.array(
+            [fitness_level({'fitness_level': document['workout'].get('difficulty')}) for document in documents],
+            dtype=np.float32,
+        )
+        equipment = np.array([len(set(document['equipment']) - NO_EQUIPMENT) for document in documents],
+                             dtype=np.float32)
+        # Score terms that don't depend on the user
+        self.static = WEIGHTS['equipment'] / (1.0 + equipment)
+
+        self.activity_muscles = np.zeros((len(ACTIVITY_MUSCLES), len(self.muscles)), dtype=np.float32)
+        self.activity_types = {activity_type: i for i, activity_type in enumerate(ACTIVITY_MUSCLES)}
+        for activity_type, muscles in ACTIVITY_MUSCLES.items():
+            for muscle in muscles:
+                self.activity_muscles[self.activity_types[activity_type], column[muscle]] = 1.0 / len(muscles)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def exposure(self, minutes):
+        """
+        Muscle exposure of users, scaled to [0, 1] per user, from their
+        (users x activity types) matrix of recent minutes
+        """
+        exposure = minutes @ self.activity_muscles
+        peaks = exposure.max(axis=1, keepdims=True)
+        np.divide(exposure, peaks, out=exposure, where=peaks > 0)
+        return exposure
+
+    def scores(self, levels, exposure):
+        """(users x workouts) scores for users' level indexes and muscle exposure"""
+        level = 1.0 - np.abs(levels[:, None] - self.difficulty[None, :]) / (len(LEVELS) - 1)
+        coverage = (1.0 - exposure) @ self.incidence.T
+        return WEIGHTS['level'] * level + WEIGHTS['coverage'] * coverage + self.static[None, :]
+
+    def top(self, levels, exposure, n=TOP_N):
+        """Per user, the (workout index, score) pairs of the best `n` workouts"""
+        n = min(n, len(self))
+        chunk = max(1, CHUNK_CELLS // len(self))
+        for start in range(0, len(levels), chunk):
+            scores = self.scores(levels[start:start + chunk], exposure[start:start + chunk])
+            best = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            best = np.take_along_axis(best, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            for indexes, values in zip(best, best_scores):
+                yield list(zip(indexes.tolist(), values.tolist()))
+
+
+def load_features(db=None):
+    db = db if db is not None else get_db()
+    documents = db[search.COLLECTION].find({}, {'muscles': 1, 'equipment': 1, 'workout.difficulty': 1},
+                                            sort=[('_id', ASCENDING)])
+    return WorkoutFeatures(documents)
+
+
+def current_features(db=None):
+    """The catalog's features, reloaded when any process changes the search documents"""
+    version = search.catalog_version(db)
+    if _features['version'] != version:
+        _features.update(version=version, features=load_features(db))
+    return _features['features']
+
+
+def recent_minutes(features, user_ids, db=None, now=None):
+    """(users x activity types) minutes over the last HISTORY_DAYS days, from the daily rollups"""
+    db = db if db is not None else get_db()
+    since = day_of((now or timezone.now()) - timedelta(days=HISTORY_DAYS))
+    rows = {user_id: i for i, user_id in enumerate(user_ids)}
+    minutes = np.zeros((len(user_ids), len(features.activity_types)), dtype=np.float32)
+    match = {'day': {'$gte': since}, 'user_id': user_ids[0] if len(user_ids) == 1 else {'$in': user_ids}}
+    for row in db.activity_rollups.aggregate([
+        {'$match': match},
+        {'$group': {'_id': {'user_id': '$user_id', 'type': '$type'},
+                    'minutes': {'$sum': '$total_duration_minutes'}}},
+    ], allowDiskUse=True):
+        user, activity_type = row['_id']['user_id'], str(row['_id']['type']).lower()
+        if user in rows and activity_type in features.activity_types:
+            minutes[rows[user], features.activity_types[activity_type]] = row['minutes']
+    return minutes
+
+
+def _document(features, user_id, best, now):
+    return {
+        '_id': user_id,
+        'workouts': [{'workout_id': features.ids[index], 'score': round(score, 4)} for index, score in best],
+        'refreshed_at': now,
+    }
+
+
+def refresh_all(db=None):
+    """
+    Score every user against the catalog and replace the stored
+    recommendations; returns the number of users scored.
+    """
+    db = db if db is not None else get_db()
+    features = load_features(db)
+    scratch = db[f'{COLLECTION}_refresh']
+    scratch.drop()
+    scored = 0
+    if len(features):
+        now = timezone.now()
+        users = db.users.find({}, {'profile': 1}, batch_size=USER_BATCH)
+        while True:
+            batch = list(islice(users, USER_BATCH))
+            if not batch:
+                break
+            user_ids = [user['_id'] for user in batch]
+            levels = np.array([fitness_level(user.get('profile')) for user in batch], dtype=np.float32)
+            exposure = features.exposure(recent_minutes(features, user_ids, db))
+            scratch.insert_many([_document(features, user_id, best, now)
+                                 for user_id, best in zip(user_ids, features.top(levels, exposure))],
+                                ordered=False)
+            scored += len(batch)
+    if scored:
+        scratch.rename(COLLECTION, dropTarget=True)
+    else:
+        db[COLLECTION].drop()
+    bump_version(COLLECTION)
+    return scored
+
+
+def refresh_user(user, db=None):
+    """Score one user (a User instance) with the cached features and store the result"""
+    db = db if db is not None else get_db()
+    features = current_features(db)
+    if not len(features):
+        return None
+    levels = np.array([fitness_level(user.profile)], dtype=np.float32)
+    exposure = features.exposure(recent_minutes(features, [user.pk], db))
+    document = _document(features, user.pk, next(features.top(levels, exposure)), timezone.now())
+    db[COLLECTION].replace_one({'_id': user.pk}, document, upsert=True)
+    return document
+
+
+def user_recommendations(user, db=None):
+    """
+    A user's recommended workouts, serialized, best first, each with its
+    `score`. Users without stored recommendations are scored on the spot;
+    returns None when that would need NumPy and it is not installed.
+    """
+    db = db if db is not None else get_db()
+    document = db[COLLECTION].find_one({'_id': user.pk})
+    if document is None:
+        if not available():
+            return None
+        document = refresh_user(user, db)
+        if document is None:
+            return []
+    scores = {entry['workout_id']: entry['score'] for entry in document['workouts']}
+    workouts = {found['_id']: found['workout']
+                for found in db[search.COLLECTION].find({'_id': {'$in': list(scores)}}, {'workout': 1})}
+    # Workouts deleted since the last refresh are skipped
+    return [dict(workouts[workout_id], score=score) for workout_id, score in scores.items()
+            if workout_id in workouts]
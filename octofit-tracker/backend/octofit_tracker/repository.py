@@ -0,0 +1,127 @@
+"""
+Native MongoDB implementations of the viewsets' hot queries.
+
+Equality filters such as `filter(user_id=...)`, `filter(team_id=...)`,
+`filter(type=...)` and `filter(difficulty=...)`, and leaderboard slices, are
+issued as find() calls sorted by the model's `Meta.ordering`, skipping the
+SQL djongo renders and re-parses for every ORM query. Documents are
+fetched with a projection and encoded with the precompiled encoders, so
+the output is identical to the serializer's.
+"""
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING
+
+from .encoders import get_encoder, model_sources, read_rows, serialize_rows
+from .mongo import get_db
+
+
+def enabled(serializer_class, fields=None):
+    return settings.OCTOFIT_NATIVE_REPOSITORY and get_encoder(serializer_class, fields) is not None
+
+
+def column(model, name):
+    return model._meta.get_field(name).column
+
+
+def mongo_sort(model):
+    """`Meta.ordering` as a pymongo sort specification"""
+    return [(column(model, name.lstrip('-')), DESCENDING if name.startswith('-') else ASCENDING)
+            for name in model._meta.ordering]
+
+
+def mongo_query(model, filters):
+    """Translate equality and `__in` filters"""
+    query = {}
+    for name, value in filters.items():
+        if name.endswith('__in'):
+            query[column(model, name[:-len('__in')])] = {'$in': list(value)}
+        else:
+            query[column(model, name)] = value
+    return query
+
+
+def projection(model, encoder):
+    keys = [model._meta.pk.name] + [name.lstrip('-') for name in model._meta.ordering]
+    return {column(model, name): 1 for name in model_sources(model, encoder.sources + keys)}
+
+
+def find(model, filters, serializer_class, fields=None, limit=None, annotate=None, db=None):
+    """
+    Encoded rows of `model.objects.filter(**filters)[:limit]`; `annotate`
+    may set computed values on the fetched documents
+    """
+    if limit == 0:
+        # pymongo reads a zero limit as no limit
+        return []
+    db = db if db is not None else get_db()
+    encoder = get_encoder(serializer_class, fields)
+    documents = db[model._meta.db_table].find(
+        mongo_query(model, filters),
+        projection(model, encoder),
+        sort=mongo_sort(model),
+        limit=limit or 0,
+    )
+    if annotate is not None:
+        documents = annotate(documents)
+    return encoder.encode_many(documents)
+
+
+def find_page(paginator, request, model, filters, serializer_class, fields=None, annotate=None, db=None):
+    """One keyset page of `model.objects.filter(**filters)`, encoded"""
+    db = db if db is not None else get_db()
+    encoder = get_encoder(serializer_class, fields)
+    query = mongo_query(model, filters)
+    ordering = column(model, paginator.ordering_field)
+    tiebreaker = column(model, paginator.tiebreaker_field)
+    collection = db[model._meta.db_table]
+    fields_projection = projection(model, encoder)
+    fields_projection.update({ordering: 1, tiebreaker: 1})
+
+    def fetch(position, reverse, limit):
+        criteria = query
+        if position is not None:
+            criteria = {'$and': [query, paginator.position_query(position, reverse, (ordering, tiebreaker))]}
+        direction = ASCENDING if reverse else DESCENDING
+        sort = [(ordering, direction), (tiebreaker, -direction)]
+        return list(collection.find(criteria, fields_projection, sort=sort, limit=limit))
+
+    page = paginator.paginate(fetch, request)
+    if annotate is not None:
+        page = annotate(page)
+    return encoder.encode_many(page)
+
+
+def rows(model, filters, serializer_class, fields=None, limit=None, context=None, annotate=None):
+    """
+    Serialized rows of `model.objects.filter(**filters)[:limit]`, read
+    natively when OCTOFIT_NATIVE_REPOSITORY is on and through the ORM
+    otherwise.
+    """
+    if enabled(serializer_class, fields):
+        return find(model, filters, serializer_class, fields, limit, annotate)
+    queryset = read_rows(model.objects.filter(**filters), serializer_class, fields)
+    if limit is not None:
+        queryset = queryset[:limit]
+    if annotate is not None:
+        queryset = annotate(queryset)
+    return serialize_rows(queryset, serializer_class, context, fields)
+
+
+class RepositoryMixin:
+    """Serves filtered list actions through `rows`/`find_page`; use with FastReadMixin"""
+
+    def filtered_rows(self, model, serializer_class=None, **filters):
+        serializer_class = serializer_class or self.get_serializer_class()
+        return rows(model, filters, serializer_class, self.selected_fields(serializer_class),
+                    context=self.get_serializer_context(), annotate=self.annotate_rows)
+
+    def filtered_page(self, model, **filters):
+        """Paginated response of `model.objects.filter(**filters)`"""
+        serializer_class = self.get_serializer_class()
+        fields = self.selected_fields(serializer_class)
+        if enabled(serializer_class, fields):
+            page = find_page(self.paginator, self.request, model, filters, serializer_class, fields,
+                             annotate=self.annotate_rows)
+            return self.get_paginated_response(page)
+        page = self.paginate_queryset(self.read_rows(model.objects.filter(**filters)))
+        return self.get_paginated_response(self.serialize_rows(page))
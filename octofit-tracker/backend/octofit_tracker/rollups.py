@@ -0,0 +1,145 @@
+"""
+Daily activity rollups per user and activity type.
+
+Each document of the `activity_rollups` collection holds one user's totals
+for one activity type on one UTC day. Activity writes fold into their day
+with an upserted `$inc`, and summaries re-bucket the days by week or month
+server-side, so trend charts read O(buckets) rows instead of every activity.
+"""
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.utils import timezone
+from pymongo import ASCENDING, UpdateOne
+
+from .mongo import get_db
+from .stats import TOTALS, activity_value, sum_totals
+
+COLLECTION = 'activity_rollups'
+BUCKETS = ('day', 'week', 'month')
+
+
+def day_of(value):
+    """Midnight UTC of the day a datetime falls on, as a naive UTC datetime"""
+    if timezone.is_aware(value):
+        value = value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return datetime.combine(value.date(), time.min)
+
+
+def rollup_id(user_id, activity_type, day):
+    return f'{user_id}|{activity_type}|{day.date().isoformat()}'
+
+
+def rollup_deltas(activities):
+    """Per-(user, type, day) total deltas for (activity, sign) pairs"""
+    deltas = {}
+    for activity, sign in activities:
+        if activity is None:
+            continue
+        key = (activity_value(activity, 'user_id'), activity_value(activity, 'type'),
+               day_of(activity_value(activity, 'date')))
+        totals = deltas.setdefault(key, dict.fromkeys(TOTALS, 0))
+        totals['total_activities'] += sign
+        totals['total_calories'] += sign * (activity_value(activity, 'calories_burned') or 0)
+        totals['total_duration_minutes'] += sign * (activity_value(activity, 'duration_minutes') or 0)
+        totals['total_distance_km'] += sign * (activity_value(activity, 'distance_km') or 0)
+    return deltas
+
+
+def apply_activity_change(before=None, after=None, db=None):
+    """Apply a create (before=None), update or delete (after=None) of an activity"""
+    _apply(rollup_deltas([(before, -1), (after, 1)]), db)
+
+
+def apply_activity_inserts(activities, db=None):
+    """Apply a batch of newly inserted activities with one bulk write"""
+    _apply(rollup_deltas((activity, 1) for activity in activities), db)
+
+
+def _apply(deltas, db=None):
+    deltas = {key: totals for key, totals in deltas.items() if any(totals.values())}
+    if not deltas:
+        return
+    db = db if db is not None else get_db()
+    ids = []
+    requests = []
+    for (user_id, activity_type, day), totals in deltas.items():
+        ids.append(rollup_id(user_id, activity_type, day))
+        requests.append(UpdateOne(
+            {'_id': ids[-1]},
+            {'$inc': totals, '$setOnInsert': {'user_id': user_id, 'type': activity_type, 'day': day}},
+            upsert=True,
+        ))
+    db[COLLECTION].bulk_write(requests, ordered=False)
+    # Days whose last activity was deleted or moved away
+    db[COLLECTION].delete_many({'_id': {'$in': ids}, 'total_activities': {'$lte': 0}})
+
+
+def rebuild_rollups(db=None):
+    """Recompute every rollup from the activities collection; returns the number written"""
+    db = db if db is not None else get_db()
+    group = {'_id': {
+        'user_id': '$user_id',
+        'type': '$type',
+        'day': {'$dateTrunc': {'date': '$date', 'unit': 'day'}},
+    }}
+    group.update(TOTALS)
+    project = {
+        '_id': {'$concat': [
+            '$_id.user_id', '|', '$_id.type', '|',
+            {'$dateToString': {'date': '$_id.day', 'format': '%Y-%m-%d'}},
+        ]},
+        'user_id': '$_id.user_id',
+        'type': '$_id.type',
+        'day': '$_id.day',
+    }
+    project.update(dict.fromkeys(TOTALS, 1))
+    db.activities.aggregate([
+        {'$group': group},
+        {'$project': project},
+        {'$out': COLLECTION},
+    ], allowDiskUse=True)
+    return db[COLLECTION].estimated_document_count()
+
+
+def summary_pipeline(user_id, bucket='day', start=None, end=None):
+    """Re-bucket a user's daily rollups by day, week or month, split by type"""
+    match = {'user_id': user_id}
+    if start or end:
+        match['day'] = {}
+        if start:
+            match['day']['$gte'] = day_of(start)
+        if end:
+            match['day']['$lt'] = end
+    if bucket == 'day':
+        start_of_bucket = '$day'
+    else:
+        start_of_bucket = {'$dateTrunc': {'date': '$day', 'unit': bucket}}
+        if bucket == 'week':
+            start_of_bucket['$dateTrunc']['startOfWeek'] = 'monday'
+    group = {'_id': {'start': start_of_bucket, 'type': '$type'}}
+    group.update({name: {'$sum': f'${name}'} for name in TOTALS})
+    return [
+        {'$match': match},
+        {'$group': group},
+        {'$sort': {'_id.start': ASCENDING, 'total_calories': -1, '_id.type': ASCENDING}},
+    ]
+
+
+def user_summary(user_id, bucket='day', start=None, end=None, db=None):
+    """
+    Return a user's totals per bucket in [start, end), each with a per-type
+    breakdown. Rollups are daily, so `start` is rounded down to its UTC day.
+    """
+    db = db if db is not None else get_db()
+    types = {}
+    for row in db[COLLECTION].aggregate(summary_pipeline(user_id, bucket, start, end)):
+        bucket_start = timezone.make_aware(row['_id']['start'], dt_timezone.utc)
+        types.setdefault(bucket_start, []).append(dict({'type': row['_id']['type']}, **sum_totals([row])))
+    return {
+        'user_id': user_id,
+        'bucket': bucket,
+        'from': start,
+        'to': end,
+        'buckets': [dict({'start': bucket_start}, **sum_totals(rows), types=rows)
+                    for bucket_start, rows in types.items()],
+    }
@@ -0,0 +1,131 @@
+"""
+Full-text workout search.
+
+Every workout has a search document in the `workout_search` collection
+holding its searchable text (name, description, exercise names, target
+muscles, equipment), normalized filter fields and its serialized API
+representation. A weighted MongoDB text index over that collection is the
+inverted index: MongoDB updates its postings as search documents are
+written, and ranks matches by a weighted, stemmed term score. A search
+is one indexed find() whose results are already serialized.
+
+Search documents are written from the ORM instance on every save or delete
+(see `signals`), so they don't depend on how the workout's JSON fields
+happen to be stored, and are rebuilt in bulk with `rebuild_search`.
+"""
+from django.utils import timezone
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+
+from .cache import bump_version
+from .models import Workout
+from .mongo import get_db
+from .serializers import WorkoutSerializer
+
+COLLECTION = 'workout_search'
+
+# Relative weight of a term match in each field
+WEIGHTS = {'name': 10, 'exercises': 5, 'muscles': 5, 'equipment': 3, 'description': 1}
+
+MAX_LIMIT = 100
+
+
+def _names(values):
+    """Exercise names from a list of exercise dicts or plain strings"""
+    names = []
+    for value in values or []:
+        name = value.get('name') if isinstance(value, dict) else value
+        if name:
+            names.append(str(name))
+    return names
+
+
+def _terms(values):
+    return sorted({str(value).strip().lower() for value in values or [] if str(value).strip()})
+
+
+def search_document(workout):
+    """The search document of a Workout instance"""
+    return {
+        '_id': workout.pk,
+        'name': workout.name,
+        'description': workout.description,
+        'exercises': _names(workout.exercises),
+        'muscles': _terms(workout.target_muscles),
+        'equipment': _terms(workout.equipment_needed),
+        'duration_minutes': workout.duration_minutes,
+        'workout': dict(WorkoutSerializer(workout).data),
+        'updated_at': timezone.now(),
+    }
+
+
+def index_workout(workout, db=None):
+    db = db if db is not None else get_db()
+    db[COLLECTION].replace_one({'_id': workout.pk}, search_document(workout), upsert=True)
+
+
+def remove_workout(workout_id, db=None):
+    db = db if db is not None else get_db()
+    db[COLLECTION].delete_one({'_id': workout_id})
+
+
+def rebuild_search(db=None):
+    """Rewrite every search document from the workouts; returns the number written"""
+    db = db if db is not None else get_db()
+    requests = []
+    ids = []
+    for workout in Workout.objects.all().iterator(chunk_size=1000):
+        ids.append(workout.pk)
+        requests.append(ReplaceOne({'_id': workout.pk}, search_document(workout), upsert=True))
+        if len(requests) == 1000:
+            db[COLLECTION].bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        db[COLLECTION].bulk_write(requests, ordered=False)
+    db[COLLECTION].delete_many({'_id': {'$nin': ids}})
+    bump_version('workouts')
+    return len(ids)
+
+
+def catalog_version(db=None):
+    """
+    (document count, latest updated_at) of the search documents. It is read
+    from the database, so every process sees a write or delete made by any
+    other, unlike cache versions under a per-process cache.
+    """
+    db = db if db is not None else get_db()
+    latest = db[COLLECTION].find_one({}, {'updated_at': 1}, sort=[('updated_at', DESCENDING)])
+    return db[COLLECTION].estimated_document_count(), latest.get('updated_at') if latest else None
+
+
+def search_query(q=None, muscle=None, equipment=None, max_duration=None):
+    query = {}
+    if q:
+        query['$text'] = {'$search': q}
+    if muscle:
+        query['muscles'] = muscle.strip().lower()
+    if equipment:
+        query['equipment'] = equipment.strip().lower()
+    if max_duration is not None:
+        query['duration_minutes'] = {'$lte': max_duration}
+    return query
+
+
+def search(q=None, muscle=None, equipment=None, max_duration=None, limit=20, db=None):
+    """
+    Serialized workouts matching the text query and filters, most relevant
+    first (by name without a text query), each with its relevance `score`.
+    """
+    db = db if db is not None else get_db()
+    query = search_query(q, muscle, equipment, max_duration)
+    projection = {'workout': 1}
+    if q:
+        projection['score'] = {'$meta': 'textScore'}
+        sort = [('score', {'$meta': 'textScore'}), ('name', ASCENDING)]
+    else:
+        sort = [('name', ASCENDING)]
+    rows = []
+    for document in db[COLLECTION].find(query, projection, sort=sort, limit=min(limit, MAX_LIMIT)):
+        row = document['workout']
+        row['score'] = round(document['score'], 4) if q else None
+        rows.append(row)
+    return rows
@@ -1,8 +1,42 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import User, Team, Activity, Workout, Leaderboard
 
 
-class UserSerializer(serializers.ModelSerializer):
+def requested_fields(request, names):
+    """
+    Return the subset of `names` selected by `?fields=` and `?exclude=` on a
+    read request, or None when the request does not narrow the output.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    include = [name for name in params.get('fields', '').split(',') if name]
+    exclude = {name for name in params.get('exclude', '').split(',') if name}
+    if not include and not exclude:
+        return None
+    return frozenset(name for name in names
+                     if (not include or name in include) and name not in exclude)
+
+
+class SparseFieldsMixin:
+    """
+    Drops the fields not selected by `?fields=` / `?exclude=` on read
+    requests, or by a `fields` set in the serializer context
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.context.get('fields')
+        if selected is None:
+            selected = requested_fields(self.context.get('request'), self.fields)
+        if selected is not None:
+            for name in list(self.fields):
+                if name not in selected:
+                    self.fields.pop(name)
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['_id', 'name', 'email', 'password', 'team_id', 'profile', 'created_at']
@@ -11,27 +45,38 @@ class UserSerializer(serializers.ModelSerializer):
         }
 
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Team
         fields = ['_id', 'name', 'description', 'created_at', 'members']
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Activity
         fields = ['_id', 'user_id', 'type', 'duration_minutes', 'calories_burned', 
                   'distance_km', 'date', 'notes']
 
 
-class WorkoutSerializer(serializers.ModelSerializer):
+class ActivityBulkSerializer(ActivitySerializer):
+    """Validates bulk-ingested activities; `_id` uniqueness is enforced by the insert"""
+    class Meta(ActivitySerializer.Meta):
+        extra_kwargs = {
+            '_id': {'validators': []}
+        }
+
+
+class WorkoutSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Workout
         fields = ['_id', 'name', 'description', 'difficulty', 'duration_minutes',
                   'exercises', 'target_muscles', 'equipment_needed', 'created_at']
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Computed on demand (see `ranks`); set on rows before serialization
+    rank = serializers.IntegerField(read_only=True, default=None)
+
     class Meta:
         model = Leaderboard
         fields = ['_id', 'user_id', 'user_name', 'team_id', 'total_activities',
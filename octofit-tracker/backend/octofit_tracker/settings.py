@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'octofit_tracker.perf.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -86,19 +87,113 @@ WSGI_APPLICATION = 'octofit_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# CLIENT holds the MongoClient options. octofit_tracker.mongo.get_client()
+# builds one process-wide client from them for the native pymongo paths and
+# management commands; Motor and worker processes build their own clients
+# from the same options. djongo opens a client per thread for ORM queries,
+# so those pools are per thread; CONN_MAX_AGE=None keeps them open across
+# requests instead of reconnecting on every one. Unset values keep the
+# driver defaults (maxPoolSize 100, no socket timeout, no compression).
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+_mongo_options = {
+    'host': os.getenv('OCTOFIT_MONGO_HOST', 'localhost'),
+    'port': int(os.getenv('OCTOFIT_MONGO_PORT', 27017)),
+    'maxPoolSize': _env_int('OCTOFIT_MONGO_MAX_POOL_SIZE'),
+    'minPoolSize': _env_int('OCTOFIT_MONGO_MIN_POOL_SIZE'),
+    'maxIdleTimeMS': _env_int('OCTOFIT_MONGO_MAX_IDLE_TIME_MS'),
+    'waitQueueTimeoutMS': _env_int('OCTOFIT_MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+    'connectTimeoutMS': _env_int('OCTOFIT_MONGO_CONNECT_TIMEOUT_MS'),
+    'socketTimeoutMS': _env_int('OCTOFIT_MONGO_SOCKET_TIMEOUT_MS'),
+    'serverSelectionTimeoutMS': _env_int('OCTOFIT_MONGO_SERVER_SELECTION_TIMEOUT_MS'),
+    # Comma-separated, e.g. "zstd,snappy,zlib"; zstd and snappy need their python packages
+    'compressors': os.getenv('OCTOFIT_MONGO_COMPRESSORS') or None,
+    'readPreference': os.getenv('OCTOFIT_MONGO_READ_PREFERENCE') or None,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'djongo',
-        'NAME': 'octofit_db',
+        'NAME': os.getenv('OCTOFIT_DB_NAME', 'octofit_db'),
         'ENFORCE_SCHEMA': False,
-        'CLIENT': {
-            'host': 'localhost',
-            'port': 27017,
-        }
+        'CONN_MAX_AGE': None,
+        'CLIENT': {name: value for name, value in _mongo_options.items() if value is not None},
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# LocMemCache evicts least-recently-used entries past MAX_ENTRIES. Point
+# OCTOFIT_CACHE_BACKEND/LOCATION at a shared backend (Redis, Memcached) so
+# invalidations are seen by every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('OCTOFIT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('OCTOFIT_CACHE_LOCATION', 'octofit'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('OCTOFIT_CACHE_MAX_ENTRIES', 1000)),
+        },
+    }
+}
+
+OCTOFIT_CACHE_ALIAS = 'default'
+OCTOFIT_CACHE_TIMEOUT = int(os.getenv('OCTOFIT_CACHE_TIMEOUT', 30))
+
+# Conditional GETs (ETag / Last-Modified, 304 Not Modified) require a cache
+# shared by every process: their ETags come from the collection versions in
+# the cache. Unlike cached payloads those never expire, so with a
+# per-process cache a write made by another worker or a management command
+# (populate_db, rebuild_aggregates) would leave clients on stale 304s
+# indefinitely, and workers would disagree on validators. They default to
+# on only when the cache backend is shared between processes.
+_PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+OCTOFIT_CONDITIONAL_GETS = os.getenv(
+    'OCTOFIT_CONDITIONAL_GETS', str(CACHES['default']['BACKEND'] not in _PROCESS_LOCAL_CACHES)
+).lower() in ('1', 'true', 'yes')
+
+
+# Fast read path: list endpoints fetch projected dicts and encode them with
+# precompiled per-serializer encoders instead of model instances + DRF fields
+OCTOFIT_FAST_READS = os.getenv('OCTOFIT_FAST_READS', 'false').lower() in ('1', 'true', 'yes')
+
+# Native repository: filtered list actions and leaderboard slices query
+# MongoDB through pymongo directly instead of djongo's SQL translation
+OCTOFIT_NATIVE_REPOSITORY = os.getenv('OCTOFIT_NATIVE_REPOSITORY', 'false').lower() in ('1', 'true', 'yes')
+
+
+# Performance instrumentation: Server-Timing on every response, and a
+# sampled share of requests logged as JSONL to a rotating file for offline
+# analysis. OCTOFIT_PERF_TRACE_MEMORY adds each sampled request's peak
+# allocation; tracemalloc is process-wide, so only turn it on under a
+# single-threaded sync server (runserver --nothreading, gunicorn sync
+# workers), never under ASGI.
+OCTOFIT_PERF_TIMING = os.getenv('OCTOFIT_PERF_TIMING', 'true').lower() in ('1', 'true', 'yes')
+OCTOFIT_PERF_SAMPLE_RATE = float(os.getenv('OCTOFIT_PERF_SAMPLE_RATE', 0))
+OCTOFIT_PERF_TRACE_MEMORY = os.getenv('OCTOFIT_PERF_TRACE_MEMORY', 'false').lower() in ('1', 'true', 'yes')
+OCTOFIT_PERF_LOG = os.getenv('OCTOFIT_PERF_LOG', str(BASE_DIR / 'logs' / 'perf.jsonl'))
+OCTOFIT_PERF_LOG_MAX_BYTES = int(os.getenv('OCTOFIT_PERF_LOG_MAX_BYTES', 10 * 1024 * 1024))
+OCTOFIT_PERF_LOG_BACKUPS = int(os.getenv('OCTOFIT_PERF_LOG_BACKUPS', 5))
+
+
+# Leaderboard snapshots: publish_snapshots writes the top entries and every
+# team's board as precompressed JSON to OCTOFIT_SNAPSHOT_DIR every
+# OCTOFIT_SNAPSHOT_INTERVAL seconds; top and by_team serve them until they
+# are older than OCTOFIT_SNAPSHOT_MAX_AGE seconds
+OCTOFIT_SNAPSHOT_DIR = os.getenv('OCTOFIT_SNAPSHOT_DIR', str(BASE_DIR / 'snapshots'))
+OCTOFIT_SNAPSHOT_INTERVAL = int(os.getenv('OCTOFIT_SNAPSHOT_INTERVAL', 60))
+OCTOFIT_SNAPSHOT_TOP_N = int(os.getenv('OCTOFIT_SNAPSHOT_TOP_N', 10))
+OCTOFIT_SNAPSHOT_MAX_AGE = int(os.getenv('OCTOFIT_SNAPSHOT_MAX_AGE', 300))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -0,0 +1,82 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import ranks, search, standings, windows
+from .cache import bump_version
+from .models import User, Team, Activity, Workout, Leaderboard
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Team)
+@receiver([post_save, post_delete], sender=Activity)
+@receiver([post_save, post_delete], sender=Workout)
+@receiver([post_save, post_delete], sender=Leaderboard)
+def collection_changed(sender, **kwargs):
+    """Bump the collection version on ORM writes (API, admin) to invalidate caches and ETags"""
+    bump_version(sender._meta.db_table)
+
+
+@receiver(pre_save, sender=User)
+def remember_team(sender, instance, **kwargs):
+    """Keep the stored team_id so a team change can move the user's standings"""
+    instance._previous_team_id = (
+        User.objects.filter(pk=instance.pk).values_list('team_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_previous_team_id', None)
+    if previous != instance.team_id:
+        standings.change_team(instance.pk, previous, instance.team_id)
+        if not created:
+            windows.change_team(instance.pk, instance.team_id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """Take the user's totals and membership out of its team"""
+    if instance.team_id:
+        standings.change_team(instance.pk, instance.team_id, None)
+        windows.change_team(instance.pk, None)
+
+
+@receiver(post_save, sender=Team)
+def team_saved(sender, instance, **kwargs):
+    standings.update_team(instance._id, instance.name)
+
+
+@receiver(post_delete, sender=Team)
+def team_deleted(sender, instance, **kwargs):
+    standings.update_team(instance._id)
+
+
+@receiver(pre_save, sender=Leaderboard)
+def remember_score(sender, instance, **kwargs):
+    """Keep the stored score so the rank tree can move it"""
+    instance._previous_calories = (
+        Leaderboard.objects.filter(pk=instance.pk).values_list('total_calories', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Leaderboard)
+def entry_saved(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_previous_calories', None)
+    ranks.move(previous, instance.total_calories)
+
+
+@receiver(post_delete, sender=Leaderboard)
+def entry_deleted(sender, instance, **kwargs):
+    ranks.move(old=instance.total_calories)
+
+
+@receiver(post_save, sender=Workout)
+def workout_saved(sender, instance, **kwargs):
+    search.index_workout(instance)
+
+
+@receiver(post_delete, sender=Workout)
+def workout_deleted(sender, instance, **kwargs):
+    search.remove_workout(instance.pk)
@@ -0,0 +1,200 @@
+"""
+Precompressed leaderboard snapshots.
+
+`publish()` renders the top of the all-time leaderboard and every team's
+board to JSON exactly as the API would, compresses each with gzip (and with
+brotli when the `brotli` package is installed), and writes all of it to
+OCTOFIT_SNAPSHOT_DIR. `manage.py publish_snapshots` publishes periodically.
+`top` and `by_team` then answer matching requests with the stored bytes in
+the best encoding the client accepts. Serving a snapshot needs no database
+query and no serialization.
+
+Each publish writes a new generation directory and then atomically repoints
+the `current` file at it, so readers never mix two snapshots. Every worker
+keeps the generation it last read in memory and only goes back to disk when
+`current` changes.
+"""
+import gzip
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from . import ranks, repository
+from .encoders import get_encoder
+from .models import Leaderboard, Team
+from .mongo import get_db
+from .serializers import LeaderboardSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings in order of preference, with their file suffixes
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'), ('identity', ''))
+KEEP_GENERATIONS = 3
+TOP = 'top'
+
+# The generation this process last read or published
+_state = {'directory': None, 'mtime': None, 'meta': None, 'bodies': {}}
+
+
+def team_snapshot(team_id):
+    return f'team-{quote(str(team_id), safe="")}'
+
+
+def compress(raw):
+    """{encoding: body} for a rendered snapshot"""
+    bodies = {'identity': raw, 'gzip': gzip.compress(raw, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(raw, quality=11)
+    return bodies
+
+
+def render_all(limit, team_ids, db=None):
+    """
+    {snapshot name: rendered JSON}, rendered like the top and by_team
+    responses. Every board is one indexed find() encoded with the
+    precompiled encoder; the top is ranked from its order, and each team's
+    board with one rank tree lookup.
+    """
+    db = db if db is not None else get_db()
+    renderer = JSONRenderer()
+    encoder = get_encoder(LeaderboardSerializer)
+    projection = repository.projection(Leaderboard, encoder)
+    top = db.leaderboard.find({}, projection, sort=ranks.LEADERBOARD_ORDER, limit=limit)
+    payloads = {TOP: encoder.encode_many(ranks.annotate_sorted(top))}
+    for team_id in team_ids:
+        board = db.leaderboard.find({'team_id': team_id}, projection, sort=ranks.LEADERBOARD_ORDER)
+        payloads[team_snapshot(team_id)] = encoder.encode_many(ranks.annotate(board, db))
+    return {name: renderer.render(payload) for name, payload in payloads.items()}
+
+
+def publish(limit=None, directory=None):
+    """
+    Render, compress and write a new snapshot generation, then make it
+    current. Returns its metadata.
+    """
+    limit = limit or settings.OCTOFIT_SNAPSHOT_TOP_N
+    directory = directory or settings.OCTOFIT_SNAPSHOT_DIR
+    generated = datetime.now(timezone.utc)
+    generation = generated.strftime('%Y%m%dT%H%M%S%fZ')
+    rendered = render_all(limit, Team.objects.values_list('pk', flat=True))
+    meta = {
+        'generation': generation,
+        'generated_at': generated.isoformat().replace('+00:00', 'Z'),
+        'timestamp': generated.timestamp(),
+        'limit': limit,
+        'snapshots': len(rendered),
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    scratch = os.path.join(directory, f'{generation}.tmp')
+    os.makedirs(scratch)
+    bodies = {}
+    for name, raw in rendered.items():
+        for encoding, body in compress(raw).items():
+            bodies[name, encoding] = body
+            with open(os.path.join(scratch, name + '.json' + dict(ENCODINGS)[encoding]), 'wb') as handle:
+                handle.write(body)
+    with open(os.path.join(scratch, 'meta.json'), 'w') as handle:
+        json.dump(meta, handle)
+    os.rename(scratch, os.path.join(directory, generation))
+    current = os.path.join(directory, 'current')
+    with open(current + '.tmp', 'w') as handle:
+        handle.write(generation)
+    os.replace(current + '.tmp', current)
+
+    _state.update(directory=directory, mtime=os.stat(current).st_mtime_ns, meta=meta, bodies=bodies)
+    _prune(directory)
+    return meta
+
+
+def _prune(directory):
+    generations = sorted(name for name in os.listdir(directory)
+                         if os.path.isdir(os.path.join(directory, name)))
+    for name in generations[:-KEEP_GENERATIONS]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def current_meta():
+    """Metadata of the current generation, or None when nothing is published"""
+    directory = settings.OCTOFIT_SNAPSHOT_DIR
+    current = os.path.join(directory, 'current')
+    try:
+        mtime = os.stat(current).st_mtime_ns
+        if _state['directory'] != directory or _state['mtime'] != mtime:
+            with open(current) as handle:
+                generation = handle.read().strip()
+            with open(os.path.join(directory, generation, 'meta.json')) as handle:
+                meta = json.load(handle)
+            _state.update(directory=directory, mtime=mtime, meta=meta, bodies={})
+    except (OSError, ValueError):
+        return None
+    return _state['meta']
+
+
+def _body(name, encoding):
+    key = (name, encoding)
+    if key not in _state['bodies']:
+        path = os.path.join(_state['directory'], _state['meta']['generation'],
+                            name + '.json' + dict(ENCODINGS)[encoding])
+        try:
+            with open(path, 'rb') as handle:
+                _state['bodies'][key] = handle.read()
+        except OSError:
+            _state['bodies'][key] = None
+    return _state['bodies'][key]
+
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows (identity unless refused)"""
+    qualities = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    accepted = {coding for coding in ('br', 'gzip') if qualities.get(coding, qualities.get('*', 0.0)) > 0}
+    if qualities.get('identity', qualities.get('*', 1.0)) > 0:
+        accepted.add('identity')
+    return accepted
+
+
+def response(request, name, limit=None):
+    """
+    The snapshot `name` in the best encoding `request` accepts, or None when
+    there is no fresh snapshot for it (the caller then serves it live).
+    """
+    meta = current_meta()
+    if meta is None or time.time() - meta['timestamp'] > settings.OCTOFIT_SNAPSHOT_MAX_AGE:
+        return None
+    if limit is not None and limit != meta['limit']:
+        return None
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    for encoding, _ in ENCODINGS:
+        if encoding not in accepted:
+            continue
+        body = _body(name, encoding)
+        if body is None:
+            continue
+        result = HttpResponse(body, content_type='application/json')
+        if encoding != 'identity':
+            result['Content-Encoding'] = encoding
+        result['Vary'] = 'Accept-Encoding'
+        result['Last-Modified'] = http_date(meta['timestamp'])
+        result['X-Snapshot-Generated-At'] = meta['generated_at']
+        return result
+    return None
@@ -0,0 +1,301 @@
+"""
+Incremental leaderboard and team standings maintenance.
+
+Activity writes are folded into the owner's leaderboard entry with an atomic
+`$inc` and its score is moved in the rank tree (see `ranks`), so a write
+never touches any other user's entry. The same deltas are added to the
+owner's team in `team_standings`, whose handful of rows is re-ranked in place.
+"""
+from django.utils import timezone
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from . import ranks
+from .cache import LEADERBOARD, TEAM_STANDINGS, bump_version
+from .encoders import iso_datetime
+from .mongo import get_db
+from .stats import activity_value
+
+
+def activity_deltas(before=None, after=None):
+    """Per-user (calories, minutes, count) deltas for an activity write"""
+    deltas = {}
+    for activity, sign in ((before, -1), (after, 1)):
+        if activity is None:
+            continue
+        totals = deltas.setdefault(activity_value(activity, 'user_id'), [0, 0, 0])
+        totals[0] += sign * (activity_value(activity, 'calories_burned') or 0)
+        totals[1] += sign * (activity_value(activity, 'duration_minutes') or 0)
+        totals[2] += sign
+    return deltas
+
+
+def apply_activity_change(before=None, after=None):
+    """Apply a create (before=None), update or delete (after=None) of an activity"""
+    _apply_deltas(activity_deltas(before, after))
+
+
+def apply_activity_inserts(activities):
+    """Apply a batch of newly inserted activities with one update per user"""
+    deltas = {}
+    for activity in activities:
+        for user_id, delta in activity_deltas(after=activity).items():
+            totals = deltas.setdefault(user_id, [0, 0, 0])
+            for i, value in enumerate(delta):
+                totals[i] += value
+    _apply_deltas(deltas)
+
+
+def _apply_deltas(deltas):
+    teams = {}
+    for user_id, (calories, minutes, count) in deltas.items():
+        if calories or minutes or count:
+            apply_delta(user_id, calories=calories, duration_minutes=minutes, activities=count, teams=teams)
+    apply_team_deltas(teams)
+
+
+def _add_team_delta(teams, team_id, **delta):
+    totals = teams.setdefault(team_id, dict.fromkeys(TEAM_DELTAS, 0))
+    for name, value in delta.items():
+        totals[name] += value
+
+
+def apply_delta(user_id, calories=0, duration_minutes=0, activities=0, db=None, teams=None):
+    """
+    Increment a user's leaderboard totals and move its score in the rank
+    tree. The team's share is applied too, or added to `teams` to be applied
+    in one batch with `apply_team_deltas`.
+    """
+    db = db if db is not None else get_db()
+    update = {
+        '$inc': {
+            'total_calories': calories,
+            'total_duration_minutes': duration_minutes,
+            'total_activities': activities,
+        },
+        '$set': {'updated_at': timezone.now()},
+    }
+    entry = db.leaderboard.find_one_and_update(
+        {'user_id': user_id}, update, return_document=ReturnDocument.AFTER
+    )
+    if entry is None:
+        if not _create_entry(db, user_id):
+            return None
+        entry = db.leaderboard.find_one_and_update(
+            {'user_id': user_id}, update, return_document=ReturnDocument.AFTER
+        )
+    ranks.move(entry['total_calories'] - calories, entry['total_calories'], db=db)
+    bump_version(LEADERBOARD)
+    if entry.get('team_id'):
+        delta = {'calories': calories, 'duration_minutes': duration_minutes, 'activities': activities}
+        if teams is None:
+            apply_team_delta(entry['team_id'], db=db, **delta)
+        else:
+            _add_team_delta(teams, entry['team_id'], **delta)
+    return entry
+
+
+def _create_entry(db, user_id):
+    """Append an empty entry at the bottom of the table for a user"""
+    user = db.users.find_one({'_id': user_id}, {'name': 1, 'team_id': 1})
+    if user is None:
+        return False
+    try:
+        db.leaderboard.insert_one({
+            '_id': f'leaderboard_{user_id}',
+            'user_id': user_id,
+            'user_name': user.get('name', ''),
+            'team_id': user.get('team_id'),
+            'total_activities': 0,
+            'total_calories': 0,
+            'total_duration_minutes': 0,
+            'updated_at': timezone.now(),
+        })
+    except DuplicateKeyError:
+        # Another writer created it first
+        return True
+    ranks.move(new=0, db=db)
+    return True
+
+
+def rebuild_leaderboard(db=None):
+    """
+    Recompute every leaderboard entry from the activities collection.
+
+    Runs inside MongoDB: activities are grouped per user, joined to their
+    user and written over the leaderboard collection with `$out` (which
+    keeps its indexes); the rank tree is then rebuilt from the new totals.
+    Returns the number of entries written.
+    """
+    db = db if db is not None else get_db()
+    db.activities.aggregate([
+        {'$group': {
+            '_id': '$user_id',
+            'total_activities': {'$sum': 1},
+            'total_calories': {'$sum': '$calories_burned'},
+            'total_duration_minutes': {'$sum': '$duration_minutes'},
+        }},
+        {'$lookup': {'from': 'users', 'localField': '_id', 'foreignField': '_id', 'as': 'user'}},
+        {'$unwind': '$user'},
+        {'$project': {
+            '_id': {'$concat': ['leaderboard_', '$_id']},
+            'user_id': '$_id',
+            'user_name': '$user.name',
+            'team_id': '$user.team_id',
+            'total_activities': 1,
+            'total_calories': 1,
+            'total_duration_minutes': 1,
+            'updated_at': '$$NOW',
+        }},
+        {'$out': 'leaderboard'},
+    ], allowDiskUse=True)
+    count = ranks.rebuild(db)
+    bump_version(LEADERBOARD)
+    return count
+
+
+TEAM_RANK_ORDER = [('total_calories', DESCENDING), ('_id', ASCENDING)]
+# Delta name: team_standings field
+TEAM_DELTAS = {
+    'calories': 'total_calories',
+    'duration_minutes': 'total_duration_minutes',
+    'activities': 'total_activities',
+    'members': 'member_count',
+}
+
+
+def apply_team_delta(team_id, calories=0, duration_minutes=0, activities=0, members=0, db=None):
+    """Increment a team's totals and member count, then re-rank the teams"""
+    apply_team_deltas({team_id: {'calories': calories, 'duration_minutes': duration_minutes,
+                                 'activities': activities, 'members': members}}, db)
+
+
+def apply_team_deltas(deltas, db=None):
+    """
+    Increment the totals and member counts of several teams, given as
+    {team_id: {delta name: value}}, with one bulk write; then re-rank the
+    teams once. Standings are only created for teams that still exist.
+    """
+    deltas = {team_id: delta for team_id, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return
+    db = db if db is not None else get_db()
+    now = timezone.now()
+
+    def update(team_id):
+        return {
+            '$inc': {TEAM_DELTAS[name]: value for name, value in deltas[team_id].items()},
+            '$set': {'updated_at': now},
+        }
+
+    result = db.team_standings.bulk_write(
+        [UpdateOne({'_id': team_id}, update(team_id)) for team_id in deltas], ordered=False
+    )
+    if result.matched_count < len(deltas):
+        # A team's first write, or a write for a team deleted since
+        known = set(db.team_standings.distinct('_id', {'_id': {'$in': list(deltas)}}))
+        names = {team['_id']: team.get('name', '') for team in db.teams.find(
+            {'_id': {'$in': [team_id for team_id in deltas if team_id not in known]}}, {'name': 1}
+        )}
+        if names:
+            db.team_standings.bulk_write([
+                UpdateOne({'_id': team_id}, {**update(team_id), '$setOnInsert': {'team_name': name}}, upsert=True)
+                for team_id, name in names.items()
+            ], ordered=False)
+    rerank_teams(db)
+    bump_version(TEAM_STANDINGS)
+
+
+def change_team(user_id, previous, team_id, db=None):
+    """
+    Move a user from team `previous` to `team_id` (either may be None): its
+    leaderboard entry follows, and its totals and membership move between
+    the teams' standings
+    """
+    db = db if db is not None else get_db()
+    # Atomic with the switch, so later deltas of the user go to the new team only
+    entry = db.leaderboard.find_one_and_update(
+        {'user_id': user_id}, {'$set': {'team_id': team_id, 'updated_at': timezone.now()}},
+        projection={'total_calories': 1, 'total_duration_minutes': 1, 'total_activities': 1},
+        return_document=ReturnDocument.AFTER,
+    ) or {}
+    if entry:
+        bump_version(LEADERBOARD)
+    teams = {}
+    for team, sign in ((previous, -1), (team_id, 1)):
+        if team:
+            _add_team_delta(teams, team, members=sign, **{
+                name: sign * entry.get(field, 0) for name, field in TEAM_DELTAS.items() if name != 'members'
+            })
+    apply_team_deltas(teams, db)
+
+
+def update_team(team_id, name=None, db=None):
+    """Follow a team rename, or drop its standing when `name` is None (deleted)"""
+    db = db if db is not None else get_db()
+    if name is None:
+        db.team_standings.delete_one({'_id': team_id})
+        rerank_teams(db)
+    else:
+        db.team_standings.update_one({'_id': team_id}, {'$set': {'team_name': name}})
+    bump_version(TEAM_STANDINGS)
+
+
+def rerank_teams(db=None):
+    """Rewrite the ranks that changed; there are few enough teams to scan them all"""
+    db = db if db is not None else get_db()
+    cursor = db.team_standings.find({}, {'rank': 1}, sort=TEAM_RANK_ORDER)
+    requests = [UpdateOne({'_id': team['_id']}, {'$set': {'rank': rank}})
+                for rank, team in enumerate(cursor, start=1) if team.get('rank') != rank]
+    if requests:
+        db.team_standings.bulk_write(requests, ordered=False)
+
+
+def rebuild_team_standings(db=None):
+    """
+    Recompute every team's totals from the leaderboard and its member count
+    from the users collection, server-side. Needs MongoDB 5.0+. Returns the
+    number of teams written.
+    """
+    db = db if db is not None else get_db()
+    totals = ('total_activities', 'total_calories', 'total_duration_minutes')
+    project = {
+        'team_name': '$name',
+        'member_count': {'$size': '$members'},
+        'updated_at': '$$NOW',
+    }
+    project.update({name: {'$sum': f'$standings.{name}'} for name in totals})
+    db.teams.aggregate([
+        {'$lookup': {'from': 'users', 'localField': '_id', 'foreignField': 'team_id',
+                     'pipeline': [{'$project': {'_id': 1}}], 'as': 'members'}},
+        {'$lookup': {'from': 'leaderboard', 'localField': '_id', 'foreignField': 'team_id',
+                     'pipeline': [{'$project': dict.fromkeys(totals, 1)}], 'as': 'standings'}},
+        {'$project': project},
+        {'$setWindowFields': {
+            'sortBy': dict(TEAM_RANK_ORDER),
+            'output': {'rank': {'$documentNumber': {}}},
+        }},
+        {'$out': 'team_standings'},
+    ], allowDiskUse=True)
+    bump_version(TEAM_STANDINGS)
+    return db.team_standings.estimated_document_count()
+
+
+def team_ranking(db=None):
+    """Every team's standing by rank, with per-member averages"""
+    db = db if db is not None else get_db()
+    ranking = []
+    for team in db.team_standings.find({}, sort=[('rank', ASCENDING)]):
+        members = team.get('member_count') or 0
+        row = {
+            'rank': team.get('rank'),
+            'team_id': team['_id'],
+            'team_name': team.get('team_name', ''),
+            'member_count': members,
+        }
+        for name in ('total_activities', 'total_calories', 'total_duration_minutes'):
+            row[name] = team.get(name, 0)
+            row['avg_' + name[len('total_'):] + '_per_member'] = round(row[name] / members, 2) if members else 0
+        row['updated_at'] = iso_datetime(team.get('updated_at'))
+        ranking.append(row)
+    return ranking
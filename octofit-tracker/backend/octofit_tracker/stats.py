@@ -0,0 +1,98 @@
+"""
+Time-windowed activity statistics computed by MongoDB.
+
+The totals are produced by a single aggregation pipeline so the database
+does the summing and only one row per group crosses the wire.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .mongo import get_db
+
+GROUP_BY_FIELDS = {
+    'type': '$type',
+}
+
+TOTALS = {
+    'total_activities': {'$sum': 1},
+    'total_calories': {'$sum': '$calories_burned'},
+    'total_duration_minutes': {'$sum': '$duration_minutes'},
+    'total_distance_km': {'$sum': {'$ifNull': ['$distance_km', 0]}},
+}
+
+
+def parse_bound(value, end=False):
+    """
+    Parse a `from`/`to` query value into an aware datetime.
+
+    A bare date covers the whole day, so as an upper bound it resolves to the
+    start of the next day. Returns None for empty values and raises ValueError
+    for malformed ones.
+    """
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is not None:
+        if end:
+            day += timedelta(days=1)
+        parsed = datetime.combine(day, time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def user_stats_pipeline(user_id, start=None, end=None, group_by=None):
+    """Build the `$match` + `$group` pipeline for a user's activities"""
+    match = {'user_id': user_id}
+    if start or end:
+        match['date'] = {}
+        if start:
+            match['date']['$gte'] = start
+        if end:
+            match['date']['$lt'] = end
+    group = {'_id': GROUP_BY_FIELDS[group_by] if group_by else None}
+    group.update(TOTALS)
+    pipeline = [{'$match': match}, {'$group': group}]
+    if group_by:
+        pipeline.append({'$sort': {'total_calories': -1, '_id': 1}})
+    return pipeline
+
+
+def user_stats(user_id, start=None, end=None, group_by=None, db=None):
+    """Return totals for a user's activities in [start, end), optionally grouped"""
+    db = db if db is not None else get_db()
+    rows = list(db.activities.aggregate(user_stats_pipeline(user_id, start, end, group_by)))
+    return summarize(user_id, rows, start, end, group_by)
+
+
+def summarize(user_id, rows, start=None, end=None, group_by=None):
+    """Shape the `$group` rows of `user_stats_pipeline` into the stats response"""
+    result = {
+        'user_id': user_id,
+        'from': start,
+        'to': end,
+    }
+    result.update(sum_totals(rows))
+    if group_by:
+        result['groups'] = [dict({group_by: row['_id']}, **sum_totals([row])) for row in rows]
+    return result
+
+
+def activity_value(activity, name):
+    """A field of an activity given as a model instance or as a raw document"""
+    if isinstance(activity, dict):
+        return activity.get(name)
+    return getattr(activity, name)
+
+
+def sum_totals(rows):
+    """TOTALS summed over `$group` rows, distance rounded to two decimals"""
+    totals = {name: sum(row[name] for row in rows) for name in TOTALS}
+    totals['total_distance_km'] = round(totals['total_distance_km'], 2)
+    return totals
@@ -0,0 +1,154 @@
+"""
+Deterministic synthetic data for populate_db.
+
+Users are generated in independent index ranges that can be generated and
+inserted in parallel. Each user and its activities come from an RNG seeded
+with (seed, user index), so the dataset is identical however the users are
+split into ranges and whatever the number of workers.
+"""
+import random
+from datetime import datetime, time, timedelta
+
+from .mongo import new_client
+
+FIRST_NAMES = [
+    'Ada', 'Alan', 'Grace', 'Linus', 'Margaret', 'Dennis', 'Barbara', 'Ken',
+    'Frances', 'Guido', 'Radia', 'Tim', 'Hedy', 'Edsger', 'Katherine', 'John',
+    'Sophie', 'Niklaus', 'Shafi', 'Donald', 'Anita', 'Bjarne', 'Mary', 'Yukihiro',
+]
+LAST_NAMES = [
+    'Lovelace', 'Turing', 'Hopper', 'Torvalds', 'Hamilton', 'Ritchie', 'Liskov',
+    'Thompson', 'Allen', 'Rossum', 'Perlman', 'Berners-Lee', 'Lamarr', 'Dijkstra',
+    'Johnson', 'McCarthy', 'Wilson', 'Wirth', 'Goldwasser', 'Knuth', 'Borg',
+    'Stroustrup', 'Keller', 'Matsumoto',
+]
+TEAM_ADJECTIVES = ['Mighty', 'Swift', 'Iron', 'Cosmic', 'Silent', 'Electric', 'Golden', 'Wild']
+TEAM_NOUNS = ['Octocats', 'Falcons', 'Titans', 'Comets', 'Wolves', 'Sharks', 'Rangers', 'Phoenixes']
+FITNESS_LEVELS = ['Beginner', 'Intermediate', 'Advanced', 'Expert']
+
+# type: (min minutes, max minutes, calories per minute, km per minute or None)
+ACTIVITY_PROFILES = {
+    'Running': (20, 90, 11.0, 0.17),
+    'Cycling': (30, 180, 8.5, 0.4),
+    'Swimming': (20, 75, 9.5, 0.04),
+    'Weight Training': (30, 90, 6.0, None),
+    'Yoga': (20, 75, 3.5, None),
+    'Boxing': (20, 60, 12.0, None),
+}
+ACTIVITY_TYPES = list(ACTIVITY_PROFILES)
+
+HISTORY_DAYS = 365
+
+
+def team_documents(count, seed, now):
+    rng = random.Random(f'{seed}-teams')
+    teams = []
+    for i in range(count):
+        name = f'{rng.choice(TEAM_ADJECTIVES)} {rng.choice(TEAM_NOUNS)} {i + 1}'
+        teams.append({
+            '_id': f'team_{i:04d}',
+            'name': name,
+            'description': f'Synthetic team #{i + 1}',
+            'created_at': now,
+            'members': [],
+        })
+    return teams
+
+
+def user_document(index, team_ids, rng, now):
+    user_id = f'user_{index:07d}'
+    return {
+        '_id': user_id,
+        'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+        'email': f'{user_id}@octofit.test',
+        'password': 'hashed_password_123',
+        'team_id': team_ids[index % len(team_ids)] if team_ids else None,
+        'profile': {
+            'age': rng.randint(16, 70),
+            'height': rng.randint(150, 200),
+            'weight': rng.randint(45, 120),
+            'fitness_level': rng.choice(FITNESS_LEVELS),
+        },
+        'created_at': now - timedelta(days=rng.randint(HISTORY_DAYS, 2 * HISTORY_DAYS)),
+    }
+
+
+def activity_documents(user_id, count, rng, now):
+    for j in range(count):
+        activity_type = rng.choice(ACTIVITY_TYPES)
+        min_minutes, max_minutes, calories_per_minute, km_per_minute = ACTIVITY_PROFILES[activity_type]
+        minutes = rng.randint(min_minutes, max_minutes)
+        yield {
+            '_id': f'activity_{user_id}_{j}',
+            'user_id': user_id,
+            'type': activity_type,
+            'duration_minutes': minutes,
+            'calories_burned': int(minutes * calories_per_minute * rng.uniform(0.8, 1.2)),
+            'distance_km': round(minutes * km_per_minute * rng.uniform(0.8, 1.2), 2) if km_per_minute else None,
+            'date': now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400)),
+            'notes': '',
+        }
+
+
+def user_rng(seed, index):
+    return random.Random(f'{seed}-{index}')
+
+
+def range_documents(start, stop, team_ids, activities_per_user, seed, now):
+    """(user, activities) for each of the users [start, stop)"""
+    for index in range(start, stop):
+        rng = user_rng(seed, index)
+        user = user_document(index, team_ids, rng, now)
+        yield user, list(activity_documents(user['_id'], activities_per_user, rng, now))
+
+
+def anchor_time():
+    """Midnight UTC today, so reruns on the same day generate identical dates"""
+    return datetime.combine(datetime.utcnow().date(), time.min)
+
+
+def populate_range(task):
+    """
+    Generate and insert users [start, stop) with their activities.
+
+    Runs in a worker process with its own client; returns the number of users
+    and activities inserted.
+    """
+    (options, db_name, start, stop, team_ids,
+     activities_per_user, seed, batch_size, now) = task
+    client = new_client(options)
+    db = client[db_name]
+    users = []
+    activities = []
+    user_count = activity_count = 0
+    try:
+        for user, user_activities in range_documents(start, stop, team_ids, activities_per_user, seed, now):
+            users.append(user)
+            activities.extend(user_activities)
+            if len(activities) >= batch_size:
+                db.activities.insert_many(activities, ordered=False)
+                activity_count += len(activities)
+                activities = []
+            if len(users) >= batch_size:
+                db.users.insert_many(users, ordered=False)
+                user_count += len(users)
+                users = []
+        if users:
+            db.users.insert_many(users, ordered=False)
+            user_count += len(users)
+        if activities:
+            db.activities.insert_many(activities, ordered=False)
+            activity_count += len(activities)
+    finally:
+        client.close()
+    return user_count, activity_count
+
+
+def link_team_members(db):
+    """Set each team's `members` from the users collection, server-side"""
+    db.users.aggregate([
+        {'$match': {'team_id': {'$ne': None}}},
+        {'$sort': {'_id': 1}},
+        {'$group': {'_id': '$team_id', 'members': {'$push': '$_id'}}},
+        {'$merge': {'into': 'teams', 'on': '_id', 'whenMatched': 'merge', 'whenNotMatched': 'discard'}},
+    ], allowDiskUse=True)
@@ -1,9 +1,26 @@
-from django.test import TestCase
+import asyncio
+import calendar
+import gzip
+import json
+import os
+import tempfile
+import threading
+from io import BytesIO, StringIO
+from unittest import skipIf
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.urls import reverse
+from django.utils.http import http_date
+from . import async_views, benchmarks, perf, ranks, recommendations, repository, search, snapshots, synthetic, windows
 from .models import User, Team, Activity, Workout, Leaderboard
-from datetime import datetime
+from .mongo import client_options, get_client, get_db
+from .serializers import ActivitySerializer, UserSerializer, WorkoutSerializer, LeaderboardSerializer
+from datetime import datetime, timedelta
 
 
 class UserAPITestCase(APITestCase):
@@ -47,6 +64,128 @@ class UserAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(User.objects.count(), 2)
 
+    def test_get_user_stats_grouped_by_type(self):
+        """Test windowed user stats aggregated by activity type"""
+        for i, activity_type in enumerate(['Running', 'Running', 'Yoga']):
+            Activity.objects.create(
+                _id=f'test_stats_activity_{i}',
+                user_id=self.user._id,
+                type=activity_type,
+                duration_minutes=30,
+                calories_burned=100 * (i + 1),
+                date=datetime(2026, 3, 10 + i)
+            )
+        url = reverse('user-stats', args=[self.user._id])
+        response = self.client.get(url, {'from': '2026-03-01', 'to': '2026-03-11', 'group_by': 'type'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_activities'], 2)
+        self.assertEqual(response.data['total_calories'], 300)
+        self.assertEqual(response.data['groups'], [{
+            'type': 'Running',
+            'total_activities': 2,
+            'total_calories': 300,
+            'total_duration_minutes': 60,
+            'total_distance_km': 0,
+        }])
+
+    @skipIf(not recommendations.available(), 'NumPy is not available')
+    def test_recommended_workouts(self):
+        """Test that workouts matching the user's level and untrained muscles rank first"""
+        Workout.objects.create(_id='test_workout_upper', name='Upper Body Basics', difficulty='Beginner',
+                               duration_minutes=30, exercises=[{'name': 'Push-ups'}],
+                               target_muscles=['Chest', 'Arms'], equipment_needed=['None'])
+        Workout.objects.create(_id='test_workout_legs', name='Heavy Legs', difficulty='Advanced',
+                               duration_minutes=60, exercises=[{'name': 'Squats'}],
+                               target_muscles=['Legs'], equipment_needed=['Barbell', 'Rack'])
+        # Drop search documents and recommendations left behind by earlier tests
+        search.rebuild_search()
+        get_db()[recommendations.COLLECTION].delete_many({})
+        self.client.post(reverse('activity-list'), {
+            '_id': 'test_recommendation_activity', 'user_id': self.user._id, 'type': 'Running',
+            'duration_minutes': 45, 'calories_burned': 450, 'date': datetime.now().isoformat(),
+        }, format='json')
+
+        url = reverse('user-recommended-workouts', args=[self.user._id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([w['_id'] for w in response.data], ['test_workout_upper', 'test_workout_legs'])
+        self.assertGreater(response.data[0]['score'], response.data[1]['score'])
+
+        self.assertEqual(recommendations.refresh_all(), User.objects.count())
+        response = self.client.get(url)
+        self.assertEqual([w['_id'] for w in response.data], ['test_workout_upper', 'test_workout_legs'])
+
+    @skipIf(not recommendations.available(), 'NumPy is not available')
+    def test_recommendation_features_follow_other_processes(self):
+        """Test that the cached catalog reloads on search document writes this process's cache never saw"""
+        Workout.objects.create(_id='test_workout_core', name='Core Basics', difficulty='Beginner',
+                               duration_minutes=20, exercises=[{'name': 'Plank'}],
+                               target_muscles=['Core'], equipment_needed=['None'])
+        search.rebuild_search()
+        self.assertIn('test_workout_core', recommendations.current_features().ids)
+        # As another process would, without bumping this process's cache version
+        get_db()[search.COLLECTION].delete_one({'_id': 'test_workout_core'})
+        self.assertNotIn('test_workout_core', recommendations.current_features().ids)
+
+    def test_activity_summary_from_rollups(self):
+        """Test weekly activity summaries maintained from activity writes"""
+        url = reverse('activity-list')
+        for i, (activity_type, day) in enumerate([('Running', 9), ('Running', 10), ('Yoga', 16)]):
+            self.client.post(url, {
+                '_id': f'test_summary_activity_{i}', 'user_id': self.user._id, 'type': activity_type,
+                'duration_minutes': 30, 'calories_burned': 100, 'date': f'2026-03-{day}T08:00:00Z',
+            }, format='json')
+        self.client.delete(reverse('activity-detail', args=['test_summary_activity_1']))
+
+        url = reverse('user-activity-summary', args=[self.user._id])
+        response = self.client.get(url, {'bucket': 'week', 'from': '2026-03-01', 'to': '2026-03-31'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        buckets = response.json()['buckets']
+        self.assertEqual([bucket['start'] for bucket in buckets], ['2026-03-09T00:00:00Z', '2026-03-16T00:00:00Z'])
+        self.assertEqual(buckets[0]['total_calories'], 100)
+        self.assertEqual(buckets[0]['types'][0]['type'], 'Running')
+
+        response = self.client.get(url, {'bucket': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_user_stats_invalid_window(self):
+        """Test that malformed stats parameters are rejected"""
+        url = reverse('user-stats', args=[self.user._id])
+        response = self.client.get(url, {'from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(OCTOFIT_CONDITIONAL_GETS=True)
+    def test_conditional_get_list(self):
+        """Test that unchanged lists are answered with 304 Not Modified"""
+        url = reverse('user-list')
+        response = self.client.get(url)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.user.name = 'Renamed User'
+        self.user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(OCTOFIT_CONDITIONAL_GETS=True)
+    def test_conditional_get_detail(self):
+        """Test that an unchanged user is answered with 304 Not Modified"""
+        url = reverse('user-detail', args=[self.user._id])
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(OCTOFIT_CONDITIONAL_GETS=False)
+    def test_conditional_get_disabled(self):
+        """Test that no validators are sent when the cache is not shared between processes"""
+        response = self.client.get(reverse('user-detail', args=[self.user._id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
+
 
 class TeamAPITestCase(APITestCase):
     def setUp(self):
@@ -72,6 +211,110 @@ class TeamAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['name'], 'Test Team')
 
+    def test_expand_members_and_leaderboard(self):
+        """Test embedding member and standing summaries in teams"""
+        User.objects.create(_id='test_user_1', name='Test User', email='test@example.com',
+                            password='hashed_password', team_id='test_team_1')
+        Leaderboard.objects.create(_id='test_leaderboard_1', user_id='test_user_1', user_name='Test User',
+                                   team_id='test_team_1', total_activities=2, total_calories=500)
+        url = reverse('team-list')
+        response = self.client.get(url, {'expand': 'members,leaderboard'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        team = response.json()[0]
+        self.assertEqual(team['name'], 'Test Team')
+        self.assertEqual(team['members'], [{'_id': 'test_user_1', 'name': 'Test User'}])
+        self.assertEqual(team['leaderboard'][0]['total_calories'], 500)
+
+        detail_url = reverse('team-detail', args=[self.team._id])
+        response = self.client.get(detail_url, {'expand': 'members'})
+        self.assertEqual(response.json()['members'], team['members'])
+        self.assertNotIn('leaderboard', response.json())
+
+        response = self.client.get(url, {'expand': 'owner'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TeamRankingTestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # The flush between tests leaves the standings of earlier teams behind
+        get_db().team_standings.delete_many({})
+        for team_id, users in (('test_team_1', 1), ('test_team_2', 2)):
+            Team.objects.create(_id=team_id, name=f'Team {team_id[-1]}')
+            for i in range(users):
+                User.objects.create(_id=f'{team_id}_user_{i}', name=f'User {i}', email=f'{team_id}_{i}@example.com',
+                                    password='hashed_password', team_id=team_id)
+
+    def test_team_ranking_follows_activity_writes(self):
+        """Test that team totals, member counts and ranks are maintained from writes"""
+        url = reverse('activity-list')
+        for i, (user_id, calories) in enumerate([('test_team_1_user_0', 500), ('test_team_2_user_0', 200),
+                                                 ('test_team_2_user_1', 200)]):
+            self.client.post(url, {
+                '_id': f'test_ranking_activity_{i}', 'user_id': user_id, 'type': 'Running',
+                'duration_minutes': 30, 'calories_burned': calories, 'date': '2026-03-01T08:00:00Z',
+            }, format='json')
+
+        response = self.client.get(reverse('team-ranking'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([team['team_id'] for team in response.data], ['test_team_1', 'test_team_2'])
+        self.assertEqual(response.data[1]['member_count'], 2)
+        self.assertEqual(response.data[1]['total_calories'], 400)
+        self.assertEqual(response.data[1]['avg_calories_per_member'], 200)
+
+        self.client.post(url, {
+            '_id': 'test_ranking_activity_3', 'user_id': 'test_team_2_user_1', 'type': 'Running',
+            'duration_minutes': 60, 'calories_burned': 300, 'date': '2026-03-02T08:00:00Z',
+        }, format='json')
+        response = self.client.get(reverse('team-ranking'))
+        self.assertEqual([team['rank'] for team in response.data], [1, 2])
+        self.assertEqual(response.data[0]['team_id'], 'test_team_2')
+
+    def test_team_switch_moves_totals(self):
+        """Test that a user changing team takes its totals and later activities along"""
+        url = reverse('activity-list')
+        for i, (user_id, calories) in enumerate([('test_team_1_user_0', 500), ('test_team_2_user_1', 200)]):
+            self.client.post(url, {
+                '_id': f'test_switch_activity_{i}', 'user_id': user_id, 'type': 'Running',
+                'duration_minutes': 30, 'calories_burned': calories, 'date': '2026-03-01T08:00:00Z',
+            }, format='json')
+        response = self.client.patch(reverse('user-detail', args=['test_team_2_user_1']),
+                                     {'team_id': 'test_team_1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Leaderboard.objects.get(user_id='test_team_2_user_1').team_id, 'test_team_1')
+        self.client.post(url, {
+            '_id': 'test_switch_activity_2', 'user_id': 'test_team_2_user_1', 'type': 'Running',
+            'duration_minutes': 30, 'calories_burned': 100, 'date': '2026-03-02T08:00:00Z',
+        }, format='json')
+
+        ranking = {team['team_id']: team for team in self.client.get(reverse('team-ranking')).data}
+        self.assertEqual((ranking['test_team_1']['member_count'], ranking['test_team_1']['total_calories']),
+                         (2, 800))
+        self.assertEqual(ranking['test_team_1']['avg_calories_per_member'], 400)
+        self.assertEqual((ranking['test_team_2']['member_count'], ranking['test_team_2']['total_calories']), (1, 0))
+
+    def test_deletes_leave_standings_consistent(self):
+        """Test that deleting a user removes its totals and a deleted team's standing is not recreated"""
+        url = reverse('activity-list')
+        for i, (user_id, calories) in enumerate([('test_team_2_user_0', 500), ('test_team_2_user_1', 200)]):
+            self.client.post(url, {
+                '_id': f'test_delete_activity_{i}', 'user_id': user_id, 'type': 'Running',
+                'duration_minutes': 30, 'calories_burned': calories, 'date': '2026-03-01T08:00:00Z',
+            }, format='json')
+        self.client.delete(reverse('user-detail', args=['test_team_2_user_0']))
+        ranking = {team['team_id']: team for team in self.client.get(reverse('team-ranking')).data}
+        self.assertEqual((ranking['test_team_2']['member_count'], ranking['test_team_2']['total_calories']),
+                         (1, 200))
+        self.assertEqual(ranking['test_team_2']['avg_calories_per_member'], 200)
+
+        self.client.delete(reverse('team-detail', args=['test_team_2']))
+        self.client.post(url, {
+            '_id': 'test_delete_activity_2', 'user_id': 'test_team_2_user_1', 'type': 'Running',
+            'duration_minutes': 30, 'calories_burned': 100, 'date': '2026-03-02T08:00:00Z',
+        }, format='json')
+        ranking = self.client.get(reverse('team-ranking')).data
+        self.assertEqual([team['team_id'] for team in ranking], ['test_team_1'])
+
 
 class ActivityAPITestCase(APITestCase):
     def setUp(self):
@@ -92,7 +335,7 @@ class ActivityAPITestCase(APITestCase):
         url = reverse('activity-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_get_activity_detail(self):
         """Test retrieving a specific activity"""
@@ -106,7 +349,83 @@ class ActivityAPITestCase(APITestCase):
         url = reverse('activity-by-user')
         response = self.client.get(url, {'user_id': 'test_user_1'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_activities_cursor_pagination(self):
+        """Test walking activities page by page with cursor tokens"""
+        for i in range(3):
+            Activity.objects.create(
+                _id=f'test_activity_page_{i}',
+                user_id='test_user_1',
+                type='Cycling',
+                duration_minutes=20,
+                calories_burned=150,
+                date=self.activity.date,
+            )
+        url = reverse('activity-by-user')
+        response = self.client.get(url, {'user_id': 'test_user_1', 'page_size': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['previous'])
+        first_page = [a['_id'] for a in response.data['results']]
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+        self.assertNotIn(response.data['results'][0]['_id'], first_page)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([a['_id'] for a in response.data['results']], first_page)
+
+    def test_bulk_ndjson_ingestion(self):
+        """Test ingesting NDJSON activities with per-line errors"""
+        lines = [
+            {'_id': 'bulk_activity_1', 'user_id': 'test_user_1', 'type': 'Yoga',
+             'duration_minutes': 40, 'calories_burned': 120, 'date': '2026-03-01T08:00:00Z'},
+            {'_id': 'bulk_activity_2', 'user_id': 'test_user_1', 'type': 'Running'},
+            {'_id': 'test_activity_1', 'user_id': 'test_user_1', 'type': 'Running',
+             'duration_minutes': 30, 'calories_burned': 250, 'date': '2026-03-01T09:00:00Z'},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+        url = reverse('activity-bulk')
+        response = self.client.generic('POST', url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['received'], 4)
+        self.assertEqual(response.data['inserted'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [2, 3, 4])
+        self.assertEqual(list(response.data['errors'][1]['errors']), ['_id'])
+        self.assertEqual(list(response.data['errors'][2]['errors']), ['non_field_errors'])
+        self.assertTrue(Activity.objects.filter(_id='bulk_activity_1').exists())
+
+        # A chunked upload, dechunked by the server, has no Content-Length
+        body = json.dumps(dict(lines[0], _id='bulk_activity_3')) + '\n'
+        chunked = {'CONTENT_LENGTH': '', 'HTTP_TRANSFER_ENCODING': 'chunked'}
+        response = self.client.generic('POST', url, body, content_type='application/x-ndjson', **chunked,
+                                       **{'wsgi.input': BytesIO(body.encode()), 'wsgi.input_terminated': True})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['inserted'], 1)
+        response = self.client.generic('POST', url, body, content_type='application/x-ndjson', **chunked)
+        self.assertEqual(response.status_code, status.HTTP_411_LENGTH_REQUIRED)
+
+    def test_export_activities(self):
+        """Test streaming activities as NDJSON and CSV"""
+        url = reverse('activity-export')
+        response = self.client.get(url, {'format': 'ndjson', 'user_id': 'test_user_1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['_id'] for row in rows], ['test_activity_1'])
+
+        response = self.client.get(url, {'format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[0], '_id')
+        self.assertEqual(len(lines), 2)
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor token is rejected"""
+        url = reverse('activity-list')
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
 class WorkoutAPITestCase(APITestCase):
@@ -137,6 +456,87 @@ class WorkoutAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['name'], 'Test Workout')
 
+    def test_search_ranks_and_filters(self):
+        """Test that workout search ranks text matches and applies the filters"""
+        call_command('sync_indexes', stdout=StringIO())
+        # Drop search documents left behind by workouts of earlier tests
+        search.rebuild_search()
+        Workout.objects.create(_id='test_workout_2', name='Leg Day', description='Squats and push-ups for legs',
+                               difficulty='Advanced', duration_minutes=45,
+                               exercises=[{'name': 'Squats', 'sets': 4, 'reps': 8}],
+                               target_muscles=['Legs'], equipment_needed=['Barbell'])
+        url = reverse('workout-search')
+        response = self.client.get(url, {'q': 'push-ups'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([w['_id'] for w in response.data], ['test_workout_1', 'test_workout_2'])
+        self.assertGreater(response.data[0]['score'], response.data[1]['score'])
+        detail = self.client.get(reverse('workout-detail', args=[self.workout._id])).data
+        self.assertEqual({k: v for k, v in response.data[0].items() if k != 'score'}, detail)
+
+        response = self.client.get(url, {'q': 'push-ups', 'muscle': 'legs', 'equipment': 'barbell'})
+        self.assertEqual([w['_id'] for w in response.data], ['test_workout_2'])
+        response = self.client.get(url, {'max_duration': 30})
+        self.assertEqual([w['_id'] for w in response.data], ['test_workout_1'])
+
+        Workout.objects.get(_id='test_workout_2').delete()
+        response = self.client.get(url, {'q': 'squats'})
+        self.assertEqual(response.data, [])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_fast_read_path_matches_serializer(self):
+        """Test that the fast read path returns exactly the serializer output"""
+        for url, params in [(reverse('workout-list'), {}),
+                            (reverse('workout-by-difficulty'), {'difficulty': 'Beginner'})]:
+            with self.settings(OCTOFIT_FAST_READS=False):
+                expected = self.client.get(url, params).json()
+            with self.settings(OCTOFIT_FAST_READS=True):
+                actual = self.client.get(url, params).json()
+            self.assertEqual(actual, expected)
+
+    def test_sparse_fieldsets(self):
+        """Test narrowing workout output with fields and exclude"""
+        url = reverse('workout-list')
+        for fast in (False, True):
+            with self.settings(OCTOFIT_FAST_READS=fast):
+                response = self.client.get(url, {'fields': '_id,name,difficulty'})
+                self.assertEqual(response.data[0], {
+                    '_id': 'test_workout_1', 'name': 'Test Workout', 'difficulty': 'Beginner'
+                })
+                response = self.client.get(url, {'exclude': 'exercises,target_muscles'})
+                self.assertNotIn('exercises', response.data[0])
+                self.assertIn('equipment_needed', response.data[0])
+
+    def test_batch_fetch_by_ids(self):
+        """Test fetching workouts by ID list in request order with missing IDs reported"""
+        Workout.objects.create(_id='test_workout_2', name='Another Workout', difficulty='Advanced',
+                               duration_minutes=45)
+        expected = {
+            'results': ['test_workout_2', 'test_workout_1'],
+            'missing': ['unknown_workout'],
+        }
+        for native in (False, True):
+            with self.settings(OCTOFIT_NATIVE_REPOSITORY=native):
+                response = self.client.get(reverse('workout-list'),
+                                           {'ids': 'test_workout_2,unknown_workout,test_workout_1'})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual([row['_id'] for row in response.data['results']], expected['results'])
+                self.assertEqual(response.data['missing'], expected['missing'])
+
+                response = self.client.get(reverse('workout-list'),
+                                           {'ids': 'test_workout_2,unknown_workout,test_workout_1', 'fields': 'name'})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data['results'], [{'name': 'Another Workout'}, {'name': 'Test Workout'}])
+                self.assertEqual(response.data['missing'], expected['missing'])
+
+        response = self.client.post(reverse('workout-batch'),
+                                    {'ids': ['test_workout_2', 'unknown_workout', 'test_workout_1']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['_id'] for row in response.data['results']], expected['results'])
+
+        response = self.client.post(reverse('workout-batch'), {'ids': 'test_workout_1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_filter_workouts_by_difficulty(self):
         """Test filtering workouts by difficulty"""
         url = reverse('workout-by-difficulty')
@@ -155,8 +555,7 @@ class LeaderboardAPITestCase(APITestCase):
             team_id='test_team_1',
             total_activities=10,
             total_calories=2000,
-            total_duration_minutes=300,
-            rank=1
+            total_duration_minutes=300
         )
 
     def test_get_leaderboard_list(self):
@@ -173,6 +572,16 @@ class LeaderboardAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['user_name'], 'Test User')
 
+    @override_settings(OCTOFIT_CONDITIONAL_GETS=True)
+    def test_last_modified_from_updated_at(self):
+        """Test that Last-Modified is the entries' latest updated_at"""
+        updated_at = Leaderboard.objects.get(pk=self.leaderboard_entry._id).updated_at
+        expected = http_date(calendar.timegm(updated_at.utctimetuple()))
+        response = self.client.get(reverse('leaderboard-list'))
+        self.assertEqual(response['Last-Modified'], expected)
+        response = self.client.get(reverse('leaderboard-detail', args=[self.leaderboard_entry._id]))
+        self.assertEqual(response['Last-Modified'], expected)
+
     def test_get_top_leaderboard(self):
         """Test retrieving top N leaderboard entries"""
         url = reverse('leaderboard-top')
@@ -180,6 +589,333 @@ class LeaderboardAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(len(response.data) <= 5)
 
+    def test_top_leaderboard_cache_invalidation(self):
+        """Test that cached leaderboard payloads are refreshed when an entry changes"""
+        url = reverse('leaderboard-top')
+        response = self.client.get(url, {'limit': 5})
+        self.assertEqual(response.data[0]['total_calories'], 2000)
+
+        detail_url = reverse('leaderboard-detail', args=[self.leaderboard_entry._id])
+        self.client.patch(detail_url, {'total_calories': 2500}, format='json')
+        response = self.client.get(url, {'limit': 5})
+        self.assertEqual(response.data[0]['total_calories'], 2500)
+
+    def test_server_timing_and_sampled_log(self):
+        """Test that requests report Server-Timing and sampled ones are logged"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'perf.jsonl')
+            with self.settings(OCTOFIT_PERF_SAMPLE_RATE=1.0, OCTOFIT_PERF_LOG=path,
+                               OCTOFIT_PERF_TRACE_MEMORY=True):
+                response = APIClient().get(reverse('leaderboard-top'), {'limit': 5})
+            self.assertIn('db;desc=', response['Server-Timing'])
+            self.assertIn('render;dur=', response['Server-Timing'])
+            with open(path) as handle:
+                record = json.loads(handle.readline())
+        self.assertEqual(record['view'], 'LeaderboardViewSet')
+        self.assertEqual(record['action'], 'top')
+        self.assertGreater(record['db_queries'], 0)
+        self.assertIsNotNone(record['peak_alloc_bytes'])
+
+    def test_server_timing_async(self):
+        """Test that the middleware awaits async views natively and counts their Motor time"""
+        async def view(request):
+            with perf.db_wait():
+                await asyncio.sleep(0)
+            return HttpResponse()
+
+        middleware = perf.PerformanceMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = asyncio.run(middleware(RequestFactory().get('/')))
+        self.assertIn('db;desc="1 queries"', response['Server-Timing'])
+
+    def test_top_served_from_snapshot(self):
+        """Test that a published snapshot answers top requests, precompressed, until republished"""
+        url = reverse('leaderboard-top')
+        with tempfile.TemporaryDirectory() as directory, self.settings(OCTOFIT_SNAPSHOT_DIR=directory):
+            live = self.client.get(url, {'limit': 5}).json()
+            snapshots.publish(limit=5)
+            detail_url = reverse('leaderboard-detail', args=[self.leaderboard_entry._id])
+            self.client.patch(detail_url, {'total_calories': 2500}, format='json')
+
+            response = self.client.get(url, {'limit': 5}, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('X-Snapshot-Generated-At', response)
+            self.assertEqual(json.loads(gzip.decompress(response.content)), live)
+            response = self.client.get(url, {'limit': 5}, HTTP_ACCEPT_ENCODING='identity')
+            self.assertEqual(json.loads(response.content), live)
+
+            # Other limits are not in the snapshot and are served live
+            response = self.client.get(url, {'limit': 3})
+            self.assertNotIn('X-Snapshot-Generated-At', response)
+            self.assertEqual(response.data[0]['total_calories'], 2500)
+
+    @skipIf(async_views.AsyncIOMotorClient is None, 'Motor is not available')
+    async def test_async_top_matches_sync_top(self):
+        """Test that the async top endpoint returns the same payload as the DRF one, under ASGI only"""
+        url = reverse('async-leaderboard-top')
+        response = await sync_to_async(self.client.get)(reverse('leaderboard-top'), {'limit': 5})
+        expected = response.json()
+        try:
+            response = await self.async_client.get(url, {'limit': 5})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json(), expected)
+            self.assertEqual((await self.async_client.get(url, {'limit': 0})).json(), [])
+            response = await self.async_client.get(url, {'limit': -1})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        finally:
+            async_views.close_async_client()
+        response = await sync_to_async(self.client.get)(url, {'limit': 5})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LeaderboardMaintenanceTestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for i, calories in enumerate([900, 600, 300], start=1):
+            User.objects.create(
+                _id=f'lb_user_{i}',
+                name=f'LB User {i}',
+                email=f'lb{i}@example.com',
+                password='hashed_password',
+                team_id='test_team_1'
+            )
+            Leaderboard.objects.create(
+                _id=f'leaderboard_lb_user_{i}',
+                user_id=f'lb_user_{i}',
+                user_name=f'LB User {i}',
+                team_id='test_team_1',
+                total_activities=1,
+                total_calories=calories,
+                total_duration_minutes=60
+            )
+        # The flush between tests leaves the rank counters of earlier entries behind
+        ranks.rebuild()
+
+    def test_activity_writes_update_leaderboard(self):
+        """Test that creating, updating and deleting activities keeps standings fresh"""
+        url = reverse('activity-list')
+        response = self.client.post(url, {
+            '_id': 'lb_activity_1',
+            'user_id': 'lb_user_3',
+            'type': 'Running',
+            'duration_minutes': 45,
+            'calories_burned': 700,
+            'date': datetime.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        entry = Leaderboard.objects.get(user_id='lb_user_3')
+        self.assertEqual(entry.total_calories, 1000)
+        self.assertEqual(entry.total_activities, 2)
+        self.assertEqual(entry.total_duration_minutes, 105)
+        ranks = {e['user_id']: e['rank'] for e in self.client.get(reverse('leaderboard-list')).data}
+        self.assertEqual(ranks, {'lb_user_3': 1, 'lb_user_1': 2, 'lb_user_2': 3})
+
+        url = reverse('activity-detail', args=['lb_activity_1'])
+        response = self.client.patch(url, {'calories_burned': 100}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ranks = {e['user_id']: e['rank'] for e in self.client.get(reverse('leaderboard-list')).data}
+        self.assertEqual(ranks, {'lb_user_1': 1, 'lb_user_2': 2, 'lb_user_3': 3})
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        entry = Leaderboard.objects.get(user_id='lb_user_3')
+        self.assertEqual(entry.total_calories, 300)
+        self.assertEqual(entry.total_activities, 1)
+
+    def test_rank_ties_and_around(self):
+        """Test that tied entries share a rank and around returns a user's neighbours"""
+        entry = Leaderboard.objects.get(user_id='lb_user_3')
+        entry.total_calories = 600
+        entry.save()
+        url = reverse('leaderboard-around', args=['lb_user_2'])
+        response = self.client.get(url, {'radius': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(e['user_id'], e['rank']) for e in response.data],
+                         [('lb_user_1', 1), ('lb_user_2', 2), ('lb_user_3', 2)])
+
+        response = self.client.get(url, {'radius': 'many'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('leaderboard-around', args=['nonexistent']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_windowed_leaderboards(self):
+        """Test that weekly and monthly standings only count activities in the current window"""
+        get_db()[windows.COLLECTION].delete_many({})
+        get_db()[windows.RANKS_COLLECTION].delete_many({})
+        url = reverse('activity-list')
+        now = datetime.now()
+        for i, (user_id, calories, date) in enumerate([
+            ('lb_user_3', 700, now),
+            ('lb_user_2', 100, now),
+            ('lb_user_1', 900, now - timedelta(days=70)),
+        ]):
+            response = self.client.post(url, {
+                '_id': f'lb_window_activity_{i}', 'user_id': user_id, 'type': 'Running',
+                'duration_minutes': 30, 'calories_burned': calories, 'date': date.isoformat(),
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        for window in ('week', 'month'):
+            response = self.client.get(reverse('leaderboard-top'), {'window': window})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([(e['user_id'], e['total_calories'], e['rank']) for e in response.data],
+                             [('lb_user_3', 700, 1), ('lb_user_2', 100, 2)])
+        response = self.client.get(reverse('leaderboard-by-team'), {'team_id': 'test_team_1', 'window': 'week'})
+        self.assertEqual(len(response.data), 2)
+        response = self.client.get(reverse('leaderboard-top'), {'window': 'week', 'limit': 0})
+        self.assertEqual(response.data, [])
+
+        # Team boards keep the ranks of the whole window, maintained or rebuilt
+        User.objects.create(_id='lb_user_4', name='LB User 4', email='lb4@example.com',
+                            password='hashed_password', team_id='test_team_2')
+        response = self.client.post(url, {
+            '_id': 'lb_window_activity_3', 'user_id': 'lb_user_4', 'type': 'Running',
+            'duration_minutes': 30, 'calories_burned': 800, 'date': now.isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        for rebuild in (False, True):
+            if rebuild:
+                windows.rebuild_windows()
+            response = self.client.get(reverse('leaderboard-by-team'), {'team_id': 'test_team_1', 'window': 'week'})
+            self.assertEqual([(e['user_id'], e['rank']) for e in response.data],
+                             [('lb_user_3', 2), ('lb_user_2', 3)])
+        response = self.client.get(reverse('leaderboard-top'), {'window': 'all'})
+        self.assertEqual(len(response.data), 3)
+        response = self.client.get(reverse('leaderboard-top'), {'window': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RepositoryParityTestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(3):
+            User.objects.create(_id=f'test_user_{i}', name=f'Test User {i}', email=f'test{i}@example.com',
+                                password='hashed_password', team_id='test_team_1')
+            Leaderboard.objects.create(_id=f'test_leaderboard_{i}', user_id=f'test_user_{i}',
+                                       user_name=f'Test User {i}', team_id='test_team_1',
+                                       total_calories=1000 - i * 100)
+            Workout.objects.create(_id=f'test_workout_{i}', name=f'Test Workout {i}', difficulty='Beginner',
+                                   duration_minutes=30, exercises=[{'name': 'Squats', 'reps': 10}])
+            for j in range(2):
+                Activity.objects.create(_id=f'test_activity_{i}_{j}', user_id=f'test_user_{i}', type='Running',
+                                        duration_minutes=30, calories_burned=250,
+                                        date=datetime(2026, 3, 1 + i, 8, j))
+
+    def test_native_queries_match_orm(self):
+        """Test that the native repository returns exactly what the ORM path returns"""
+        cases = [
+            (Activity, {'user_id': 'test_user_1'}, ActivitySerializer, None),
+            (User, {'team_id': 'test_team_1'}, UserSerializer, None),
+            (Workout, {'difficulty': 'Beginner'}, WorkoutSerializer, None),
+            (Leaderboard, {'team_id': 'test_team_1'}, LeaderboardSerializer, None),
+            (Leaderboard, {}, LeaderboardSerializer, 2),
+            (Leaderboard, {}, LeaderboardSerializer, 0),
+        ]
+        for model, filters, serializer_class, limit in cases:
+            queryset = model.objects.filter(**filters)
+            expected = serializer_class(queryset[:limit] if limit is not None else queryset, many=True).data
+            self.assertEqual(repository.find(model, filters, serializer_class, limit=limit), expected)
+
+        for native in (False, True):
+            with self.settings(OCTOFIT_NATIVE_REPOSITORY=native):
+                response = self.client.get(reverse('leaderboard-top'), {'limit': 0})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data, [])
+                response = self.client.get(reverse('leaderboard-top'), {'limit': -1})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_native_pagination_matches_orm(self):
+        """Test that native keyset pages match the ORM pages"""
+        url = reverse('activity-by-type')
+        pages = {}
+        for native in (False, True):
+            with self.settings(OCTOFIT_NATIVE_REPOSITORY=native):
+                response = self.client.get(url, {'type': 'Running', 'page_size': 4})
+                pages[native] = [response.json()['results']]
+                response = self.client.get(response.data['next'])
+                pages[native].append(response.json()['results'])
+        self.assertEqual(pages[True], pages[False])
+        self.assertEqual(len(pages[True][1]), 2)
+
+
+class SyntheticDataTestCase(TestCase):
+    def test_generation_is_deterministic(self):
+        """Test that a seed generates the same documents however the users are split into ranges"""
+        now = synthetic.anchor_time()
+        teams = synthetic.team_documents(3, 7, now)
+        self.assertEqual(teams, synthetic.team_documents(3, 7, now))
+        team_ids = [team['_id'] for team in teams]
+        documents = list(synthetic.range_documents(0, 10, team_ids, 3, 7, now))
+        self.assertEqual(documents, list(synthetic.range_documents(0, 10, team_ids, 3, 7, now)))
+        split = (list(synthetic.range_documents(0, 4, team_ids, 3, 7, now))
+                 + list(synthetic.range_documents(4, 10, team_ids, 3, 7, now)))
+        self.assertEqual(split, documents)
+        self.assertNotEqual(documents, list(synthetic.range_documents(0, 10, team_ids, 3, 8, now)))
+
+    def test_team_members_match_users(self):
+        """Test that linked team members are exactly the users pointing at each team"""
+        db = get_db()
+        now = synthetic.anchor_time()
+        teams = synthetic.team_documents(3, 7, now)
+        db.teams.insert_many(teams)
+        team_ids = [team['_id'] for team in teams]
+        self.assertEqual(synthetic.populate_range((client_options(), db.name, 0, 10, team_ids, 2, 7, 4, now)),
+                         (10, 20))
+        synthetic.link_team_members(db)
+        for team in db.teams.find({'_id': {'$in': team_ids}}):
+            members = [user['_id'] for user in db.users.find({'team_id': team['_id']}, {'_id': 1}, sort=[('_id', 1)])]
+            self.assertTrue(members)
+            self.assertEqual(team['members'], members)
+
+
+class IndexManagementTestCase(TestCase):
+    def test_sync_indexes_removes_collection_scans(self):
+        """Test that every endpoint query shape uses an index after syncing"""
+        call_command('sync_indexes', stdout=StringIO())
+        call_command('sync_indexes', '--check', stdout=StringIO())
+
+
+class BenchmarkReportTestCase(SimpleTestCase):
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(benchmarks.percentile(values, 50), 50)
+        self.assertEqual(benchmarks.percentile(values, 99), 99)
+        self.assertEqual(benchmarks.percentile([7], 95), 7)
+
+    def test_compare_flags_regressions(self):
+        """Test that endpoints slower than the threshold are flagged"""
+        def report(p95):
+            return {'scales': [{'label': '1000', 'endpoints': {
+                'users list': {'p95_ms': p95['users list']},
+                'leaderboard top': {'p95_ms': p95['leaderboard top']},
+            }}]}
+        base = report({'users list': 10.0, 'leaderboard top': 4.0})
+        head = report({'users list': 10.5, 'leaderboard top': 6.0})
+        rows = benchmarks.compare(base, head, threshold=0.10)
+        regressed = {name for _, name, _, _, _, flag in rows if flag}
+        self.assertEqual(regressed, {'leaderboard top'})
+
+
+class PoolMetricsTestCase(APITestCase):
+    def test_pool_metrics(self):
+        """Test that pool counters report the checkouts made by queries"""
+        User.objects.count()
+        response = self.client.get(reverse('pool-metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(response.data['checkouts'], 0)
+        self.assertGreater(response.data['open'], 0)
+        self.assertIn('checkout_wait_ms_max', response.data)
+
+    def test_client_shared_across_threads(self):
+        """Test that every thread gets the same process-wide client"""
+        clients = []
+        thread = threading.Thread(target=lambda: clients.append(get_client()))
+        thread.start()
+        thread.join()
+        self.assertIs(clients[0], get_client())
+        self.assertEqual(get_db().name, connection.settings_dict['NAME'])
+
 
 class APIRootTestCase(APITestCase):
     def test_api_root(self):
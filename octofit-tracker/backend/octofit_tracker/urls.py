@@ -20,9 +20,10 @@ from rest_framework import routers
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
+from . import async_views
 from .views import (
     UserViewSet, TeamViewSet, ActivityViewSet,
-    WorkoutViewSet, LeaderboardViewSet
+    WorkoutViewSet, LeaderboardViewSet, pool_metrics
 )
 
 
@@ -61,5 +62,20 @@ router.register(r'leaderboard', LeaderboardViewSet, basename='leaderboard')
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', api_root, name='api-root'),
+    path('api/metrics/pool/', pool_metrics, name='pool-metrics'),
     path('api/', include(router.urls)),
 ]
+
+# Async read endpoints, served with Motor under ASGI (asgi.py) only; they
+# answer 404 to WSGI requests
+if async_views.AsyncIOMotorClient is not None:
+    urlpatterns += [
+        path('api/async/leaderboard/top/', async_views.leaderboard_top, name='async-leaderboard-top'),
+        path('api/async/leaderboard/by_team/', async_views.leaderboard_by_team,
+             name='async-leaderboard-by-team'),
+        path('api/async/users/<str:pk>/activities/', async_views.user_activities,
+             name='async-user-activities'),
+        path('api/async/users/<str:pk>/stats/', async_views.user_stats, name='async-user-stats'),
+        path('api/async/teams/<str:pk>/members/', async_views.team_members,
+             name='async-team-members'),
+    ]
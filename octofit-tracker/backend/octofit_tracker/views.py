@@ -1,14 +1,28 @@
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
+from . import (
+    expand, export, ranks, recommendations, repository, rollups, search, snapshots, standings, stats, windows
+)
+from .batch import BatchFetchMixin
+from .cache import LEADERBOARD, TEAM_STANDINGS, get_or_compute
+from .conditional import ConditionalGetMixin
+from .encoders import FastReadMixin, get_encoder
+from .ingest import ActivityIngest, request_lines
 from .models import User, Team, Activity, Workout, Leaderboard
+from .mongo import pool_stats
+from .pagination import ActivityCursorPagination
+from .repository import RepositoryMixin
+from .renderers import CSVRenderer, NDJSONRenderer
 from .serializers import (
     UserSerializer, TeamSerializer, ActivitySerializer,
     WorkoutSerializer, LeaderboardSerializer
 )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ConditionalGetMixin, BatchFetchMixin, RepositoryMixin, FastReadMixin, viewsets.ModelViewSet):
     """
     API endpoint for users
     """
@@ -19,74 +33,224 @@ class UserViewSet(viewsets.ModelViewSet):
     def activities(self, request, pk=None):
         """Get all activities for a specific user"""
         user = self.get_object()
-        activities = Activity.objects.filter(user_id=user._id)
-        serializer = ActivitySerializer(activities, many=True)
-        return Response(serializer.data)
+        return Response(self.filtered_rows(Activity, ActivitySerializer, user_id=user._id))
 
     @action(detail=True, methods=['get'])
     def stats(self, request, pk=None):
-        """Get statistics for a specific user"""
+        """Get statistics for a specific user, optionally windowed by date and grouped"""
         user = self.get_object()
+        params = request.query_params
+        if any(params.get(name) for name in ('from', 'to', 'group_by')):
+            group_by = params.get('group_by') or None
+            if group_by and group_by not in stats.GROUP_BY_FIELDS:
+                return Response({'error': f'group_by must be one of: {", ".join(stats.GROUP_BY_FIELDS)}'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                start = stats.parse_bound(params.get('from'))
+                end = stats.parse_bound(params.get('to'), end=True)
+            except ValueError:
+                return Response({'error': 'from and to must be ISO 8601 dates or datetimes'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            return Response(stats.user_stats(user._id, start, end, group_by))
         leaderboard_entry = Leaderboard.objects.filter(user_id=user._id).first()
         if leaderboard_entry:
+            ranks.annotate([leaderboard_entry])
             serializer = LeaderboardSerializer(leaderboard_entry)
             return Response(serializer.data)
         return Response({'message': 'No stats available'}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=True, methods=['get'], url_path='activity-summary')
+    def activity_summary(self, request, pk=None):
+        """Get a user's activity totals per day, week or month from the daily rollups"""
+        user = self.get_object()
+        params = request.query_params
+        bucket = params.get('bucket') or 'day'
+        if bucket not in rollups.BUCKETS:
+            return Response({'error': f'bucket must be one of: {", ".join(rollups.BUCKETS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = stats.parse_bound(params.get('from'))
+            end = stats.parse_bound(params.get('to'), end=True)
+        except ValueError:
+            return Response({'error': 'from and to must be ISO 8601 dates or datetimes'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(rollups.user_summary(user._id, bucket, start, end))
+
+    @action(detail=True, methods=['get'], url_path='recommended-workouts')
+    def recommended_workouts(self, request, pk=None):
+        """Get the workouts recommended for a user, best first, from the nightly refresh"""
+        user = self.get_object()
+        rows = get_or_compute(recommendations.COLLECTION, f'user:{user._id}',
+                              lambda: recommendations.user_recommendations(user))
+        if rows is None:
+            return Response({'error': 'Recommendations are unavailable: NumPy is not installed'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(self.narrow_rows(rows, WorkoutSerializer))
+
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(ConditionalGetMixin, BatchFetchMixin, RepositoryMixin, FastReadMixin, viewsets.ModelViewSet):
     """
     API endpoint for teams
     """
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
 
+    def expansions(self):
+        return expand.parse_expand(self.request, expand.TEAM_EXPANSIONS)
+
+    def collections(self):
+        try:
+            expansions = self.expansions()
+        except ValueError:
+            expansions = ()
+        related = {'members': User._meta.db_table, 'leaderboard': Leaderboard._meta.db_table}
+        return super().collections() + [related[name] for name in sorted(expansions)]
+
+    def expanded_rows(self, match):
+        """Teams with `?expand=members,leaderboard` joined in a single aggregation"""
+        return expand.expanded_teams(match, self.expansions(), self.selected_fields())
+
+    def batch_rows(self, ids, fields):
+        if self.expansions():
+            return expand.expanded_teams({'_id': {'$in': ids}}, self.expansions(), fields)
+        return super().batch_rows(ids, fields)
+
+    def list_response(self, request, *args, **kwargs):
+        try:
+            if self.expansions() and not self.batch_requested():
+                return Response(self.expanded_rows({}))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list_response(request, *args, **kwargs)
+
+    def retrieve_response(self, instance):
+        try:
+            if self.expansions():
+                return Response(self.expanded_rows({'_id': instance._id})[0])
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().retrieve_response(instance)
+
+    @action(detail=False, methods=['get'])
+    def ranking(self, request):
+        """Get every team ranked by total calories, from the maintained team standings"""
+        return Response(get_or_compute(TEAM_STANDINGS, 'ranking', standings.team_ranking))
+
     @action(detail=True, methods=['get'])
     def members(self, request, pk=None):
         """Get all members of a team"""
         team = self.get_object()
-        users = User.objects.filter(team_id=team._id)
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        return Response(self.filtered_rows(User, UserSerializer, team_id=team._id))
 
     @action(detail=True, methods=['get'])
     def leaderboard(self, request, pk=None):
         """Get leaderboard for a specific team"""
         team = self.get_object()
-        leaderboard = Leaderboard.objects.filter(team_id=team._id)
-        serializer = LeaderboardSerializer(leaderboard, many=True)
-        return Response(serializer.data)
+        payload = LeaderboardViewSet.team_payload(team._id)
+        return Response(self.narrow_rows(payload, LeaderboardSerializer))
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(ConditionalGetMixin, BatchFetchMixin, RepositoryMixin, FastReadMixin, viewsets.ModelViewSet):
     """
     API endpoint for activities
     """
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    pagination_class = ActivityCursorPagination
+
+    # Aggregates maintained incrementally from activity writes
+    aggregates = (standings, rollups, windows)
+
+    def perform_create(self, serializer):
+        serializer.save()
+        for aggregate in self.aggregates:
+            aggregate.apply_activity_change(after=serializer.instance)
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        before = {
+            name: getattr(instance, name)
+            for name in ('user_id', 'type', 'date', 'calories_burned', 'duration_minutes', 'distance_km')
+        }
+        serializer.save()
+        for aggregate in self.aggregates:
+            aggregate.apply_activity_change(before=before, after=serializer.instance)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        for aggregate in self.aggregates:
+            aggregate.apply_activity_change(before=instance)
 
     @action(detail=False, methods=['get'])
     def by_user(self, request):
         """Get activities filtered by user_id query parameter"""
         user_id = request.query_params.get('user_id', None)
         if user_id:
-            activities = Activity.objects.filter(user_id=user_id)
-            serializer = self.get_serializer(activities, many=True)
-            return Response(serializer.data)
+            return self.filtered_page(Activity, user_id=user_id)
         return Response({'error': 'user_id parameter required'}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Ingest newline-delimited JSON activities in chunked, unordered batches"""
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', 1000))
+        except ValueError:
+            chunk_size = 0
+        if chunk_size <= 0:
+            return Response({'error': 'chunk_size must be a positive integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        lines = request_lines(request)
+        if lines is None:
+            return Response({'error': 'Content-Length required (this server does not accept chunked uploads)'},
+                            status=status.HTTP_411_LENGTH_REQUIRED)
+        ingest = ActivityIngest(chunk_size=min(chunk_size, 10000))
+        ingest.feed(lines)
+        summary = ingest.summary()
+        if not summary['failed']:
+            return Response(summary, status=status.HTTP_201_CREATED)
+        if not summary['inserted']:
+            return Response(summary, status=status.HTTP_400_BAD_REQUEST)
+        return Response(summary, status=status.HTTP_207_MULTI_STATUS)
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, format=None):
+        """Stream activities as NDJSON or CSV from a server-side cursor"""
+        try:
+            since = stats.parse_bound(request.query_params.get('since'))
+        except ValueError:
+            return Response({'error': 'since must be an ISO 8601 date or datetime'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            batch_size = int(request.query_params.get('batch_size', 1000))
+        except ValueError:
+            batch_size = 0
+        if batch_size <= 0:
+            return Response({'error': 'batch_size must be a positive integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        rows = export.activity_rows(
+            user_id=request.query_params.get('user_id'),
+            since=since,
+            batch_size=min(batch_size, 10000),
+        )
+        renderer = request.accepted_renderer
+        if renderer.format == 'csv':
+            stream = export.csv_stream(rows)
+        else:
+            stream = export.ndjson_stream(rows)
+        response = StreamingHttpResponse(stream, content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="activities.{renderer.format}"'
+        return response
+
     @action(detail=False, methods=['get'])
     def by_type(self, request):
         """Get activities filtered by type query parameter"""
         activity_type = request.query_params.get('type', None)
         if activity_type:
-            activities = Activity.objects.filter(type=activity_type)
-            serializer = self.get_serializer(activities, many=True)
-            return Response(serializer.data)
+            return self.filtered_page(Activity, type=activity_type)
         return Response({'error': 'type parameter required'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(ConditionalGetMixin, BatchFetchMixin, RepositoryMixin, FastReadMixin, viewsets.ModelViewSet):
     """
     API endpoint for workouts
     """
@@ -98,33 +262,131 @@ class WorkoutViewSet(viewsets.ModelViewSet):
         """Get workouts filtered by difficulty query parameter"""
         difficulty = request.query_params.get('difficulty', None)
         if difficulty:
-            workouts = Workout.objects.filter(difficulty=difficulty)
-            serializer = self.get_serializer(workouts, many=True)
-            return Response(serializer.data)
+            return Response(self.filtered_rows(Workout, difficulty=difficulty))
         return Response({'error': 'difficulty parameter required'}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Search workouts by text, ranked by relevance, optionally filtered by muscle, equipment and duration"""
+        params = request.query_params
+        q = params.get('q', '').strip()
+        muscle = params.get('muscle') or None
+        equipment = params.get('equipment') or None
+        if not (q or muscle or equipment or params.get('max_duration')):
+            return Response({'error': 'q, muscle, equipment or max_duration parameter required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            max_duration = int(params['max_duration']) if params.get('max_duration') else None
+            limit = int(params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'max_duration and limit must be integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= search.MAX_LIMIT:
+            return Response({'error': f'limit must be between 1 and {search.MAX_LIMIT}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        rows = search.search(q, muscle, equipment, max_duration, limit)
+        return Response(self.narrow_rows(rows))
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
+
+class LeaderboardViewSet(ConditionalGetMixin, BatchFetchMixin, FastReadMixin, viewsets.ModelViewSet):
     """
     API endpoint for leaderboard
     """
     queryset = Leaderboard.objects.all()
     serializer_class = LeaderboardSerializer
+    max_around_radius = 50
+
+    def annotate_rows(self, rows):
+        return ranks.annotate(rows)
+
+    def retrieve_response(self, instance):
+        ranks.annotate([instance])
+        return super().retrieve_response(instance)
+
+    @staticmethod
+    def top_payload(limit, window='all'):
+        if window != 'all':
+            # Keyed by the window's start so a new week or month starts a new payload
+            start = windows.window_start(window, timezone.now())
+            return get_or_compute(LEADERBOARD, f'top:{window}:{start.date()}:{limit}',
+                                  lambda: windows.rows(window, limit=limit))
+
+        def compute():
+            return repository.rows(Leaderboard, {}, LeaderboardSerializer, limit=limit,
+                                   annotate=ranks.annotate)
+        return get_or_compute(LEADERBOARD, f'top:{limit}', compute)
+
+    @staticmethod
+    def team_payload(team_id, window='all'):
+        if window != 'all':
+            start = windows.window_start(window, timezone.now())
+            return get_or_compute(LEADERBOARD, f'team:{window}:{start.date()}:{team_id}',
+                                  lambda: windows.rows(window, {'team_id': team_id}))
+
+        def compute():
+            return repository.rows(Leaderboard, {'team_id': team_id}, LeaderboardSerializer,
+                                   annotate=ranks.annotate)
+        return get_or_compute(LEADERBOARD, f'team:{team_id}', compute)
+
+    def serves_snapshot(self, request, window):
+        """Whether a published snapshot (all-time, every field, JSON) can answer the request"""
+        return (window == 'all' and self.selected_fields() is None
+                and request.accepted_renderer.format == 'json')
 
     @action(detail=False, methods=['get'])
     def top(self, request):
-        """Get top N entries from leaderboard"""
-        limit = int(request.query_params.get('limit', 10))
-        leaderboard = Leaderboard.objects.all()[:limit]
-        serializer = self.get_serializer(leaderboard, many=True)
-        return Response(serializer.data)
+        """Get top N entries from the all-time, weekly or monthly leaderboard"""
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            return Response({'error': 'limit must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            window = windows.parse_window(request.query_params.get('window'))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if self.serves_snapshot(request, window):
+            snapshot = snapshots.response(request, snapshots.TOP, limit=limit)
+            if snapshot is not None:
+                return snapshot
+        return Response(self.narrow_rows(self.top_payload(limit, window)))
 
     @action(detail=False, methods=['get'])
     def by_team(self, request):
-        """Get leaderboard filtered by team_id query parameter"""
+        """Get the all-time, weekly or monthly leaderboard filtered by team_id query parameter"""
         team_id = request.query_params.get('team_id', None)
-        if team_id:
-            leaderboard = Leaderboard.objects.filter(team_id=team_id)
-            serializer = self.get_serializer(leaderboard, many=True)
-            return Response(serializer.data)
-        return Response({'error': 'team_id parameter required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not team_id:
+            return Response({'error': 'team_id parameter required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            window = windows.parse_window(request.query_params.get('window'))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if self.serves_snapshot(request, window):
+            snapshot = snapshots.response(request, snapshots.team_snapshot(team_id))
+            if snapshot is not None:
+                return snapshot
+        return Response(self.narrow_rows(self.team_payload(team_id, window)))
+
+    @action(detail=False, methods=['get'], url_path=r'around/(?P<user_id>[^/.]+)')
+    def around(self, request, user_id=None):
+        """Get a user's leaderboard entry with up to `radius` neighbours above and below"""
+        try:
+            radius = int(request.query_params.get('radius', 5))
+        except ValueError:
+            radius = -1
+        if not 0 <= radius <= self.max_around_radius:
+            return Response({'error': f'radius must be an integer between 0 and {self.max_around_radius}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        fields = self.selected_fields()
+        encoder = get_encoder(LeaderboardSerializer, fields)
+        entries = ranks.around(user_id, radius, repository.projection(Leaderboard, encoder))
+        if entries is None:
+            return Response({'message': 'No leaderboard entry for this user'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(encoder.encode_many(ranks.annotate(entries)))
+
+
+@api_view(['GET'])
+def pool_metrics(request):
+    """Connection pool counters for this worker process"""
+    return Response(pool_stats.snapshot())
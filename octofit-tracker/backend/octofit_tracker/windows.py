@@ -0,0 +1,280 @@
+"""
+Weekly and monthly leaderboards.
+
+Each document of the `leaderboard_windows` collection holds one user's
+totals for one calendar week (starting Monday, UTC) or month. Activity writes
+fold into the window their date falls in with an upserted `$inc`, so the
+current window's standings are an indexed find() sorted by calories instead
+of an aggregation over activities. Every document carries the end of its
+window in `expires_at`, and a TTL index drops it once the window is over.
+
+Ranks are computed like the all-time ones (see `ranks`): each window keeps
+its own score-count tree in `leaderboard_window_ranks`, which expires with
+it. The top of a window needs no tree, its ranks follow from the order.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+from pymongo import ReturnDocument
+
+from . import ranks
+from .cache import LEADERBOARD, bump_version
+from .encoders import get_encoder
+from .indexes import INDEXES
+from .mongo import get_db
+from .ranks import LEADERBOARD_ORDER
+from .rollups import day_of
+from .serializers import LeaderboardSerializer
+from .stats import activity_value
+
+COLLECTION = 'leaderboard_windows'
+RANKS_COLLECTION = 'leaderboard_window_ranks'
+WINDOWS = ('week', 'month')
+CHOICES = WINDOWS + ('all',)
+TOTALS = ('total_activities', 'total_calories', 'total_duration_minutes')
+
+
+def parse_window(value):
+    """The window named by `?window=` (default all); ValueError on unknown names"""
+    window = value or 'all'
+    if window not in CHOICES:
+        raise ValueError(f'window must be one of: {", ".join(CHOICES)}')
+    return window
+
+
+def window_start(window, value):
+    """Start of the week or month a datetime falls in, as a naive UTC datetime"""
+    day = day_of(value)
+    if window == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def window_end(window, start):
+    if window == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def tree_name(window, start):
+    """Name of a window's rank tree, also the prefix of its documents' `_id`s"""
+    return f'{window}|{start.date().isoformat()}'
+
+
+def window_id(window, start, user_id):
+    return f'{tree_name(window, start)}|{user_id}'
+
+
+def window_deltas(activities, now=None):
+    """
+    Per-(window, start, user) total deltas for (activity, sign) pairs.
+    Activities dated before the current windows are skipped: their windows
+    are over and have expired.
+    """
+    now = now or timezone.now()
+    current = {window: window_start(window, now) for window in WINDOWS}
+    deltas = {}
+    for activity, sign in activities:
+        if activity is None:
+            continue
+        for window in WINDOWS:
+            start = window_start(window, activity_value(activity, 'date'))
+            if start < current[window]:
+                continue
+            key = (window, start, activity_value(activity, 'user_id'))
+            totals = deltas.setdefault(key, dict.fromkeys(TOTALS, 0))
+            totals['total_activities'] += sign
+            totals['total_calories'] += sign * (activity_value(activity, 'calories_burned') or 0)
+            totals['total_duration_minutes'] += sign * (activity_value(activity, 'duration_minutes') or 0)
+    return deltas
+
+
+def apply_activity_change(before=None, after=None, db=None):
+    """Apply a create (before=None), update or delete (after=None) of an activity"""
+    _apply(window_deltas([(before, -1), (after, 1)]), db)
+
+
+def apply_activity_inserts(activities, db=None):
+    """Apply a batch of newly inserted activities with one bulk write"""
+    _apply(window_deltas((activity, 1) for activity in activities), db)
+
+
+def _apply(deltas, db=None):
+    deltas = {key: totals for key, totals in deltas.items() if any(totals.values())}
+    if not deltas:
+        return
+    db = db if db is not None else get_db()
+    # Like the all-time leaderboard, entries carry the user's current name and team
+    user_ids = list({user_id for _, _, user_id in deltas})
+    users = {user['_id']: user for user in db.users.find({'_id': {'$in': user_ids}}, {'name': 1, 'team_id': 1})}
+    now = timezone.now()
+    moves = {}
+    for (window, start, user_id), totals in deltas.items():
+        user = users.get(user_id)
+        if user is None:
+            continue
+        entry = db[COLLECTION].find_one_and_update(
+            {'_id': window_id(window, start, user_id)},
+            {
+                '$inc': totals,
+                '$set': {'user_name': user.get('name', ''), 'team_id': user.get('team_id'), 'updated_at': now},
+                '$setOnInsert': {'user_id': user_id, 'window': window, 'start': start,
+                                 'expires_at': window_end(window, start)},
+            },
+            projection={'total_activities': 1, 'total_calories': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        # Entries are deleted with their last activity, so one that had none is new
+        existed = entry['total_activities'] - totals['total_activities'] > 0
+        old = entry['total_calories'] - totals['total_calories'] if existed else None
+        new = entry['total_calories'] if entry['total_activities'] > 0 else None
+        if new is None:
+            # The window's last activity was deleted or moved away
+            db[COLLECTION].delete_one({'_id': entry['_id'], 'total_activities': {'$lte': 0}})
+        moves.setdefault((window, start), []).append((old, new))
+    if not moves:
+        return
+    requests = []
+    for (window, start), changes in moves.items():
+        requests += ranks.move_requests(changes, tree_name(window, start),
+                                        {'expires_at': window_end(window, start)})
+    if requests:
+        db[RANKS_COLLECTION].bulk_write(requests, ordered=False)
+    bump_version(LEADERBOARD)
+
+
+def change_team(user_id, team_id, db=None):
+    """Follow a user's team change in its current weekly and monthly entries"""
+    db = db if db is not None else get_db()
+    now = timezone.now()
+    ids = [window_id(window, window_start(window, now), user_id) for window in WINDOWS]
+    if db[COLLECTION].update_many({'_id': {'$in': ids}}, {'$set': {'team_id': team_id}}).modified_count:
+        bump_version(LEADERBOARD)
+
+
+def rebuild_windows(db=None):
+    """
+    Recompute the current windows from the daily activity rollups (see
+    `rollups`); returns the number of documents written. They are built in a
+    scratch collection and swapped in with a rename, so the boards are never
+    empty or partial while this runs.
+    """
+    db = db if db is not None else get_db()
+    scratch = db[f'{COLLECTION}_rebuild']
+    scratch.drop()
+    # The renamed collection keeps the scratch collection's indexes
+    scratch.create_indexes(INDEXES[COLLECTION])
+    for window in WINDOWS:
+        start = {'$dateTrunc': {'date': '$day', 'unit': window}}
+        if window == 'week':
+            start['$dateTrunc']['startOfWeek'] = 'monday'
+        group = {'_id': {'user_id': '$user_id', 'start': start}}
+        group.update({name: {'$sum': f'${name}'} for name in TOTALS})
+        project = {
+            '_id': {'$concat': [
+                window, '|', {'$dateToString': {'date': '$_id.start', 'format': '%Y-%m-%d'}}, '|', '$_id.user_id',
+            ]},
+            'user_id': '$_id.user_id',
+            'user_name': {'$ifNull': ['$user.name', '']},
+            'team_id': '$user.team_id',
+            'window': {'$literal': window},
+            'start': '$_id.start',
+            'expires_at': {'$dateAdd': {'startDate': '$_id.start', 'unit': window, 'amount': 1}},
+            'updated_at': '$$NOW',
+        }
+        project.update(dict.fromkeys(TOTALS, 1))
+        db.activity_rollups.aggregate([
+            {'$match': {'day': {'$gte': window_start(window, timezone.now())}}},
+            {'$group': group},
+            {'$lookup': {
+                'from': 'users',
+                'localField': '_id.user_id',
+                'foreignField': '_id',
+                'pipeline': [{'$project': {'name': 1, 'team_id': 1}}],
+                'as': 'user',
+            }},
+            # Users that no longer exist have no leaderboard entry either
+            {'$unwind': '$user'},
+            {'$project': project},
+            {'$merge': {'into': scratch.name, 'whenMatched': 'replace'}},
+        ], allowDiskUse=True)
+    scratch.rename(COLLECTION, dropTarget=True)
+    rebuild_ranks(db)
+    bump_version(LEADERBOARD)
+    return db[COLLECTION].estimated_document_count()
+
+
+def rebuild_ranks(db=None):
+    """
+    Rebuild every window's rank tree from the window entries, in a scratch
+    collection swapped in with a rename like `ranks.rebuild`.
+    """
+    db = db if db is not None else get_db()
+    counts = {}
+    for row in db[COLLECTION].aggregate([
+        {'$group': {
+            '_id': {
+                'window': '$window',
+                'start': '$start',
+                'score': {'$min': [{'$max': [{'$ifNull': ['$total_calories', 0]}, 0]}, ranks.SIZE - 1]},
+            },
+            'count': {'$sum': 1},
+        }},
+    ], allowDiskUse=True):
+        key = (row['_id']['window'], row['_id']['start'])
+        counts.setdefault(key, []).append((row['_id']['score'], row['count']))
+
+    documents = []
+    for (window, start), scores in counts.items():
+        tree, expires_at = tree_name(window, start), window_end(window, start)
+        documents += [{'_id': ranks.node_id(node, tree), 'count': count, 'expires_at': expires_at}
+                      for node, count in ranks.tree_nodes(scores).items()]
+    scratch = db[f'{RANKS_COLLECTION}_rebuild']
+    scratch.drop()
+    if not documents:
+        db[RANKS_COLLECTION].delete_many({})
+        return
+    for start in range(0, len(documents), 10000):
+        scratch.insert_many(documents[start:start + 10000], ordered=False)
+    scratch.create_indexes(INDEXES[RANKS_COLLECTION])
+    scratch.rename(RANKS_COLLECTION, dropTarget=True)
+
+
+def window_query(window, filters=None, now=None):
+    """Find filter for the entries of the current week or month, narrowed by `filters`"""
+    query = dict(filters or {})
+    query.update({'window': window, 'start': window_start(window, now or timezone.now())})
+    return query
+
+
+def whole_window(query):
+    """Whether `query` matches a whole window rather than a team's part of it"""
+    return set(query) == {'window', 'start'}
+
+
+def annotate(query, documents, db=None):
+    """
+    Set the rank within their window on documents found with `query`, in
+    leaderboard order from the top of the results
+    """
+    if whole_window(query):
+        return ranks.annotate_sorted(documents)
+    return ranks.annotate(documents, db, RANKS_COLLECTION, tree_name(query['window'], query['start']))
+
+
+def rows(window, filters=None, limit=None, db=None):
+    """
+    Current `window` standings matching `filters`, ranked and encoded like
+    LeaderboardSerializer output.
+    """
+    if limit == 0:
+        # pymongo reads a zero limit as no limit
+        return []
+    db = db if db is not None else get_db()
+    encoder = get_encoder(LeaderboardSerializer)
+    query = window_query(window, filters)
+    projection = dict.fromkeys(encoder.sources, 1)
+    projection.update({field: 1 for field, _ in LEADERBOARD_ORDER})
+    documents = list(db[COLLECTION].find(query, projection, sort=LEADERBOARD_ORDER, limit=limit or 0))
+    return encoder.encode_many(annotate(query, documents, db))